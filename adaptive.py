@@ -0,0 +1,146 @@
+# Name: adaptive.py
+# Description: Adaptive passage selection; scores every corpus line against the user's per-character error rates with NumPy
+# Author: Sanika Surose
+
+import json
+import os
+import random
+from collections import deque
+import corpus
+
+try:
+    import numpy as np
+except ImportError:         # adaptive selection is optional; sessions fall back to a random line without NumPy
+    np = None
+
+# constants
+MATRIX_SUFFIX = ".freq.npy"                 # (alphabet x lines) uint8 character densities, column per line
+META_SUFFIX = ".freq.json"                  # corpus mtime/size/line count the matrix was built from
+FIRST_CHAR = 32                             # the alphabet is printable ASCII, " " through "~"
+ALPHABET_SIZE = 95
+DENSITY_SCALE = 1000                        # densities are stored per mille, capped at 255
+BUILD_CHUNK = 65536                         # lines counted per NumPy pass while building the matrix
+MAX_WEAK_CHARS = 8                          # highest error rates used for scoring; each costs one pass over a row
+TOP_K = 32                                  # best lines a passage is drawn from, weighted by score
+RECENT_LINES = 50                           # lines picked recently are not picked again
+
+# (corpus version, matrix, tie breaks) per corpus path, kept for the life of the process
+_matrices = {}
+
+# recently picked line ids per corpus path, so practice does not keep serving the same best line
+_recent = {}
+
+
+# matrix_path: returns the sidecar frequency matrix path for a corpus file
+def matrix_path(corpus_path):
+    return corpus_path + MATRIX_SUFFIX
+
+
+# _densities: returns a (lines x alphabet) uint8 array of per-mille character densities for a batch of lines
+def _densities(lines):
+    data = [line.encode("utf-8") for line in lines]
+    lengths = np.fromiter(map(len, data), dtype=np.int64, count=len(data))
+    codes = np.frombuffer(b"".join(data), dtype=np.uint8).astype(np.int64) - FIRST_CHAR
+    line_ids = np.repeat(np.arange(len(data)), lengths)
+
+    # bytes outside the alphabet (including UTF-8 continuation bytes) still count towards the line length
+    keep = (codes >= 0) & (codes < ALPHABET_SIZE)
+    counts = np.bincount(line_ids[keep] * ALPHABET_SIZE + codes[keep], minlength=len(data) * ALPHABET_SIZE)
+    density = counts.reshape(len(data), ALPHABET_SIZE) * DENSITY_SCALE // np.maximum(lengths, 1)[:, None]
+    return np.minimum(density, 255).astype(np.uint8)
+
+
+# build_matrix: streams the corpus once and writes its character-density matrix next to it
+def build_matrix(corpus_path):
+    count = corpus.ensure_index(corpus_path)
+    stat = os.stat(corpus_path)
+    path = matrix_path(corpus_path)
+    tmp_path = path + ".tmp.npy"
+
+    # one contiguous row per character, so scoring reads only the rows of the weak characters
+    matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=(ALPHABET_SIZE, count))
+    start = 0
+    batch = []
+    for line in corpus.iter_lines(corpus_path):
+        batch.append(line)
+        if len(batch) == BUILD_CHUNK:
+            matrix[:, start:start + len(batch)] = _densities(batch).T
+            start += len(batch)
+            batch = []
+    if batch:
+        matrix[:, start:start + len(batch)] = _densities(batch).T
+    matrix.flush()
+    del matrix
+
+    os.replace(tmp_path, path)
+    with open(corpus_path + META_SUFFIX, "w") as f:
+        json.dump({"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "lines": count}, f)
+
+
+# load_matrix: returns (memory-mapped frequency matrix, per-line random tie breaks) for a corpus,
+# rebuilding the matrix if the corpus changed
+def load_matrix(corpus_path):
+    stat = os.stat(corpus_path)
+    cached = _matrices.get(corpus_path)
+    if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached[1:]
+
+    try:
+        with open(corpus_path + META_SUFFIX, "r") as f:
+            meta = json.load(f)
+        current = (meta["mtime_ns"], meta["size"]) == (stat.st_mtime_ns, stat.st_size)
+    except (OSError, json.JSONDecodeError, KeyError):
+        current = False
+
+    if not current or not os.path.exists(matrix_path(corpus_path)):
+        build_matrix(corpus_path)
+
+    matrix = np.load(matrix_path(corpus_path), mmap_mode="r")
+    tie_breaks = np.random.default_rng().integers(0, 1 << 16, matrix.shape[1], dtype=np.uint32)
+    _matrices[corpus_path] = ((stat.st_mtime_ns, stat.st_size), matrix, tie_breaks)
+    return matrix, tie_breaks
+
+
+# score_lines: returns a uint32 score per line: the error-rate-weighted density of the user's weakest characters
+# in the high 16 bits and a random tie break in the low 16 (argpartition slows down badly on many equal values)
+def score_lines(matrix, tie_breaks, error_rates):
+    weakest = sorted(error_rates.items(), key=lambda item: item[1], reverse=True)[:MAX_WEAK_CHARS]
+    weakest = [(ord(char) - FIRST_CHAR, rate) for char, rate in weakest if 0 <= ord(char) - FIRST_CHAR < ALPHABET_SIZE]
+    total = sum(rate for _, rate in weakest)
+
+    scores = tie_breaks.copy()
+    product = np.empty_like(scores)
+    for row, rate in weakest:
+        # the weights add up to at most 255, so a weighted sum of uint8 densities fits in 16 bits
+        weight = np.uint32(int(255 * rate / total) << 16)
+        np.multiply(matrix[row], weight, out=product)
+        scores += product
+    return scores
+
+
+# pick_line: returns a corpus line dense in the characters the user gets wrong most often
+# (error_rates is {char: errors / attempts}); None if NumPy is missing or no line has those characters
+def pick_line(corpus_path, error_rates, rng=random):
+    if np is None or not error_rates:
+        return None
+
+    matrix, tie_breaks = load_matrix(corpus_path)
+    scores = score_lines(matrix, tie_breaks, error_rates)
+    if not len(scores):
+        return None
+
+    served = _recent.setdefault(corpus_path, deque(maxlen=RECENT_LINES))
+    recent = [line_id for line_id in served if line_id < len(scores)]
+    scores[recent] = 0
+
+    # the k best lines in O(lines), then a score-weighted draw among them so passages vary
+    k = min(TOP_K, len(scores))
+    top = np.argpartition(scores, len(scores) - k)[len(scores) - k:]
+    weights = scores[top] >> 16
+    top, weights = top[weights > 0], weights[weights > 0]
+    if not len(top):
+        return None
+
+    line_id = rng.choices(top.tolist(), weights=weights.tolist())[0]
+    served.append(line_id)
+    return corpus.read_line(corpus_path, line_id)
@@ -0,0 +1,873 @@
+# Name: bench.py
+# Description: Performance benchmarks for the typing engine (python bench.py <benchmark> --help)
+# Author: Sanika Surose
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from unittest import mock
+import corpus
+import engine
+import keytrace
+import persistence
+import replay
+import score
+import sqlite_store
+import viewport
+
+# constants
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+CORPUS_SIZES = ["1K", "64K", "1M", "16M", "256M", "1G"]
+
+
+# parse_size: converts a size like "64K" or "1G" to bytes
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+# write_corpus: writes a synthetic corpus of roughly `size` bytes built from the lines of text.txt
+def write_corpus(path, size):
+    with open("text.txt", "r") as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    rng = random.Random(0)
+    written = 0
+    with open(path, "w") as f:
+        while written < size:
+            line = rng.choice(lines) + "\n"
+            f.write(line)
+            written += len(line)
+
+
+# legacy_load_text: the pre-index load_text, reading every line on each call
+def legacy_load_text(path):
+    with open(path, "r") as f:
+        lines = f.readlines()
+        return random.choice(lines).strip()
+
+
+# time_call: returns the mean wall time in milliseconds of `repeat` calls to fn
+def time_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+# bench_corpus: compares passage selection with readlines() against the line-offset index
+def bench_corpus(args):
+    max_size = parse_size(args.max_size)
+    sizes = [s for s in CORPUS_SIZES if parse_size(s) <= max_size]
+
+    print(f"{'corpus':>8} {'readlines ms':>14} {'index build ms':>16} {'indexed ms':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in sizes:
+            path = os.path.join(tmp, f"corpus_{label}.txt")
+            write_corpus(path, parse_size(label))
+
+            # the legacy path reads the whole file, so large corpora get fewer repeats
+            legacy_repeat = max(1, min(args.repeat, (64 * 1024 ** 2) // parse_size(label)))
+            legacy_ms = time_call(lambda: legacy_load_text(path), legacy_repeat)
+            build_ms = time_call(lambda: corpus.build_index(path), 1)
+            indexed_ms = time_call(lambda: corpus.random_line(path), args.repeat)
+
+            print(f"{label:>8} {legacy_ms:>14.3f} {build_ms:>16.3f} {indexed_ms:>12.3f}")
+            os.remove(path)
+            os.remove(corpus.index_path(path))
+
+
+# legacy_create_session: the dict-based session used before engine.Session
+def legacy_create_session(target_text):
+    return {
+        "target_text": target_text,
+        "current_text": [],
+        "start_time": time.time(),
+        "finished": False,
+        "mistakes": 0,
+        "total_keystrokes": 0,
+        "char_errors": {},
+        "char_timings": {},
+        "last_key_time": None,
+        "char_states": ["untyped"] * len(target_text),
+        "state_changes": {}
+    }
+
+
+# legacy_process_key: process_key as it worked on the dict-based session (typing only, no backspace)
+def legacy_process_key(session, key):
+    now = time.time()
+    delay = None if session["last_key_time"] is None else now - session["last_key_time"]
+    session["last_key_time"] = now
+
+    expected = session["target_text"][len(session["current_text"])]
+    session["current_text"].append(key)
+    session["total_keystrokes"] += 1
+
+    if delay is not None:
+        session["char_timings"].setdefault(expected, []).append(delay)
+
+    index = len(session["current_text"]) - 1
+    state = "correct" if key == expected else "incorrect"
+    if key != expected:
+        session["mistakes"] += 1
+        session["char_errors"][expected] = session["char_errors"].get(expected, 0) + 1
+    session["char_states"][index] = state
+
+    if len(session["current_text"]) == len(session["target_text"]):
+        session["finished"] = True
+
+
+# measure_session: returns (bytes held after typing all of target_text, peak bytes, seconds)
+def measure_session(create, process, target_text):
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    session = create(target_text)
+    for char in target_text:
+        process(session, char)
+
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, peak, elapsed
+
+
+# bench_memory: compares memory held by the dict session and engine.Session while typing long passages
+def bench_memory(args):
+    print(f"{'chars':>9} {'dict KiB':>10} {'Session KiB':>12} {'dict peak':>10} {'Session peak':>13} {'dict s':>8} {'Session s':>10}")
+    for length in args.lengths:
+        target_text = source_text(length)
+
+        # the front ends read the state changes after every key
+        def process(session, key):
+            engine.process_key(session, key)
+            engine.pop_state_changes(session)
+
+        dict_now, dict_peak, dict_s = measure_session(legacy_create_session, legacy_process_key, target_text)
+        obj_now, obj_peak, obj_s = measure_session(engine.Session, process, target_text)
+
+        print(f"{length:>9} {dict_now / 1024:>10.1f} {obj_now / 1024:>12.1f} {dict_peak / 1024:>10.1f} "
+              f"{obj_peak / 1024:>13.1f} {dict_s:>8.3f} {obj_s:>10.3f}")
+
+
+# source_text: returns text.txt joined into one passage, repeated or cut to `length` characters
+def source_text(length):
+    with open("text.txt", "r") as f:
+        source = " ".join(line.strip() for line in f if line.strip())
+    return (source * (length // len(source) + 1))[:length]
+
+
+# bench_keys: replays synthetic keystroke streams headlessly and writes per-key latency results as JSON
+def bench_keys(args):
+    results = []
+    for length in args.lengths:
+        target_text = source_text(length)
+        for profile in args.profiles:
+            stream = list(replay.synthetic_stream(target_text, profile, seed=args.seed))
+            session, latencies = replay.replay(target_text, stream)
+
+            start = time.perf_counter_ns()
+            replay.analyze(session)
+            analytics_us = (time.perf_counter_ns() - start) / 1000
+
+            result = {"profile": profile, "target_length": length, **replay.summarize_latencies(latencies),
+                      "analytics_us": round(analytics_us, 3)}
+            results.append(result)
+            print(f"{profile:>16} {length:>7} chars  {result['keys']:>7} keys  {result['keys_per_second']:>9} keys/s  "
+                  f"p50 {result['p50_us']:>7.2f}us  p99 {result['p99_us']:>7.2f}us  analytics {result['analytics_us']:>9.1f}us")
+
+    with open(args.out, "w") as f:
+        json.dump({
+            "benchmark": "keys",
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results
+        }, f, indent=2)
+    print(f"Wrote {args.out}")
+
+
+# bench_sketch: checks the delay histograms against the exact per-character lists they replace (quantile error, memory)
+def bench_sketch(args):
+    import sketch
+
+    rng = random.Random(args.seed)
+    quantiles = (0.5, 0.9, 0.99)
+
+    failures = []
+    print(f"{'keys':>9} {'lists KB':>10} {'histograms KB':>14} {'buckets':>8} "
+          + " ".join(f"{f'p{round(q * 100)} err %':>10}" for q in quantiles))
+    for count in args.keys:
+        target_text = source_text(count)
+        # roughly typist-shaped delays: a long right tail plus the odd pause
+        delays = [rng.lognormvariate(-1.7, 0.5) if rng.random() > 0.01 else rng.uniform(1, 10) for _ in range(count)]
+
+        tracemalloc.start()
+        lists = {}
+        for char, delay in zip(target_text, delays):
+            lists.setdefault(char, []).append(delay)
+        lists_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        overall, histograms = sketch.DelayHistogram(), {}
+        for char, delay in zip(target_text, delays):
+            overall.add(delay)
+            histogram = histograms.get(char)
+            if histogram is None:
+                histogram = histograms[char] = sketch.DelayHistogram()
+            histogram.add(delay)
+        histogram_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        # worst relative error over the whole stream and every character with enough samples, rank-matched
+        lists[None], histograms[None] = delays, overall
+        worst = []
+        for q in quantiles:
+            errors = [0.0]
+            for char, values in lists.items():
+                if len(values) >= args.min_samples:
+                    exact = sorted(values)[int(q * (len(values) - 1))]
+                    errors.append(abs(histograms[char].quantile(q) - exact) / exact)
+            worst.append(max(errors) * 100)
+
+        # every histogram stays inside the fixed bucket range, however many delays it holds
+        buckets = max(len(histogram.counts) for histogram in histograms.values())
+        if buckets > sketch.BUCKETS:
+            failures.append(f"{count} keys: a histogram holds {buckets} buckets, over {sketch.BUCKETS}")
+        for q, error in zip(quantiles, worst):
+            if error > sketch.RELATIVE_ACCURACY * 100:
+                failures.append(f"{count} keys: p{round(q * 100)} is off by {error:.2f}%")
+
+        print(f"{count:>9} {lists_bytes / 1024:>10.1f} {histogram_bytes / 1024:>14.1f} {buckets:>8} "
+              + " ".join(f"{error:>10.2f}" for error in worst))
+    print(f"bound: {sketch.RELATIVE_ACCURACY * 100:.2f}% error, {sketch.BUCKETS} buckets")
+
+    if failures:
+        sys.exit("sketch bounds exceeded:\n  " + "\n  ".join(failures))
+
+
+# legacy_render: the pre-tag update_display, re-inserting every character on each keystroke
+def legacy_render(text_widget, session):
+    import tkinter as tk
+
+    states = engine.build_char_states(session["target_text"], session["current_text"])
+    text_widget.config(state=tk.NORMAL)
+    text_widget.delete("1.0", tk.END)
+    for char, state in states:
+        text_widget.insert(tk.END, char, state)
+    text_widget.config(state=tk.DISABLED)
+
+
+# bench_render: compares per-keystroke Tk handler time, full re-insert vs tag ranges (needs a display)
+def bench_render(args):
+    import tkinter as tk
+    import tktext
+
+    root = tk.Tk()
+    root.withdraw()
+
+    print(f"{'chars':>7} {'re-insert p50 ms':>17} {'re-insert p99 ms':>17} {'tags p50 ms':>12} {'tags p99 ms':>12} "
+          f"{'window p50 ms':>14} {'window p99 ms':>14}")
+    for length in args.lengths:
+        target_text = source_text(length)
+        stream = list(replay.synthetic_stream(target_text, "typos", seed=args.seed))[:args.keys]
+        row = []
+
+        for mode in ("legacy", "tags", "window"):
+            text_widget = tk.Text(root, font=("Courier", 16), wrap=tk.WORD, width=70, height=5)
+            for state, color in (("correct", "green"), ("incorrect", "red"), ("untyped", "gray")):
+                text_widget.tag_config(state, foreground=color)
+
+            session = engine.Session(target_text, start_ns=0)
+            view = viewport.Viewport(target_text, 70)
+            if mode == "tags":
+                tktext.load_target(text_widget, target_text)
+            elif mode == "window":
+                tktext.load_window(text_widget, view, target_text, session.char_states)
+            timings = []
+
+            # one handler call = process_key + repaint + Tk's idle redraw, as in TypingScreen.on_key_press
+            for key, now_ns in stream:
+                start = time.perf_counter_ns()
+                engine.process_key(session, key, now_ns)
+                if mode == "legacy":
+                    legacy_render(text_widget, session)
+                elif mode == "tags":
+                    tktext.apply_state_changes(text_widget, engine.pop_state_changes(session))
+                else:
+                    changes = engine.pop_state_changes(session)
+                    if view.follow(len(session.typed)):
+                        tktext.load_window(text_widget, view, target_text, session.char_states)
+                    else:
+                        tktext.apply_window_changes(text_widget, view, changes)
+                root.update_idletasks()
+                timings.append(time.perf_counter_ns() - start)
+
+            text_widget.destroy()
+            timings.sort()
+            row += [replay.percentile(timings, 50) / 1e6, replay.percentile(timings, 99) / 1e6]
+
+        print(f"{length:>7} {row[0]:>17.3f} {row[1]:>17.3f} {row[2]:>12.3f} {row[3]:>12.3f} "
+              f"{row[4]:>14.3f} {row[5]:>14.3f}")
+
+    root.destroy()
+
+
+# bench_viewport: per-key cost of keeping a scrolling window over passages of growing length (no display needed)
+def bench_viewport(args):
+    print(f"{'chars':>9} {'first paint ms':>15} {'key p50 us':>11} {'key p99 us':>11} {'scrolls':>8}")
+    for length in args.lengths:
+        target_text = source_text(length)
+        stream = list(replay.synthetic_stream(target_text[:args.keys * 2], "typos", seed=args.seed))[:args.keys]
+
+        # first paint: lay out and visit only the visible lines
+        start = time.perf_counter_ns()
+        view = viewport.Viewport(target_text, args.width, args.height)
+        painted = sum(end - begin for _, begin, end in view.lines())
+        first_ms = (time.perf_counter_ns() - start) / 1e6
+
+        session = engine.Session(target_text, start_ns=0)
+        timings = []
+        scrolls = 0
+        for key, now_ns in stream:
+            start = time.perf_counter_ns()
+            engine.process_key(session, key, now_ns)
+            changes = engine.pop_state_changes(session)
+            if view.follow(len(session.typed)):
+                painted = sum(end - begin for _, begin, end in view.lines())
+                scrolls += 1
+            else:
+                painted = [view.position(i) for i, _, _ in changes]
+            timings.append(time.perf_counter_ns() - start)
+
+        summary = replay.summarize_latencies(timings)
+        print(f"{length:>9} {first_ms:>15.3f} {summary['p50_us']:>11.2f} {summary['p99_us']:>11.2f} {scrolls:>8}")
+
+
+# write_word_corpus: writes `count` lines of words shuffled from text.txt, so every line has a different character mix
+def write_word_corpus(path, count, seed=0):
+    with open("text.txt", "r") as f:
+        words = f.read().split()
+
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for _ in range(count):
+            f.write(" ".join(rng.choices(words, k=rng.randint(6, 16))) + "\n")
+
+
+# bench_adaptive: times building the character-frequency matrix and picking adaptive lines as the corpus grows
+def bench_adaptive(args):
+    import adaptive
+
+    error_rates = {"z": 0.4, "q": 0.3, "x": 0.25, "j": 0.2, ";": 0.1}
+    rng = random.Random(args.seed)
+
+    print(f"{'lines':>9} {'build s':>8} {'matrix MB':>10} {'pick p50 ms':>12} {'pick p99 ms':>12}")
+    for count in args.lines:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "corpus.txt")
+            write_word_corpus(path, count, args.seed)
+            corpus.ensure_index(path)
+
+            start = time.perf_counter()
+            adaptive.build_matrix(path)
+            build_s = time.perf_counter() - start
+            adaptive.load_matrix(path)
+
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter_ns()
+                adaptive.pick_line(path, error_rates, rng)
+                timings.append(time.perf_counter_ns() - start)
+            timings.sort()
+
+            size_mb = os.path.getsize(adaptive.matrix_path(path)) / 1024 ** 2
+            adaptive._matrices.clear()
+
+        print(f"{count:>9} {build_s:>8.2f} {size_mb:>10.1f} {replay.percentile(timings, 50) / 1e6:>12.3f} "
+              f"{replay.percentile(timings, 99) / 1e6:>12.3f}")
+
+
+# write_book: writes a synthetic book of roughly `size` bytes: hard-wrapped paragraphs of sentences shuffled from
+# text.txt words, with about one sentence in ten repeated from earlier in the book
+def write_book(path, size, seed=0):
+    with open("text.txt", "r") as f:
+        words = f.read().split()
+
+    rng = random.Random(seed)
+    earlier = []
+    written = 0
+    with open(path, "w") as f:
+        while written < size:
+            sentences = []
+            for _ in range(rng.randint(3, 8)):
+                if earlier and rng.random() < 0.1:
+                    sentences.append(rng.choice(earlier))
+                else:
+                    sentence = " ".join(rng.choices(words, k=rng.randint(6, 24))).capitalize().rstrip(".,;") + "."
+                    sentences.append(sentence)
+                    if len(earlier) < 1000:
+                        earlier.append(sentence)
+
+            paragraph_words = " ".join(sentences).split()
+            paragraph = "\n".join(" ".join(paragraph_words[i:i + 12]) for i in range(0, len(paragraph_words), 12))
+            f.write(paragraph + "\n\n")
+            written += len(paragraph) + 2
+
+
+# bench_ingest: ingestion throughput and peak Python memory by input size (memory should stay flat)
+def bench_ingest(args):
+    import ingest
+
+    max_size = parse_size(args.max_size)
+    sizes = [s for s in CORPUS_SIZES if parse_size(s) <= max_size]
+
+    print(f"{'input':>8} {'MB/s':>7} {'peak MB':>8} {'easy':>9} {'medium':>9} {'hard':>9}")
+    for label in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "book.txt")
+            write_book(path, parse_size(label), args.seed)
+
+            out_dir = os.path.join(tmp, "corpus")
+            start = time.perf_counter()
+            counts = ingest.ingest([path], out_dir, dedupe_mb=args.dedupe_mb)
+            elapsed = time.perf_counter() - start
+
+            # tracemalloc slows every allocation down, so memory is measured on a second, untimed run
+            tracemalloc.start()
+            ingest.ingest([path], out_dir, dedupe_mb=args.dedupe_mb)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        print(f"{label:>8} {parse_size(label) / 1024 ** 2 / elapsed:>7.2f} {peak / 1024 ** 2:>8.1f} "
+              + " ".join(f"{counts[name]:>9}" for name in corpus.DIFFICULTIES))
+
+
+# synthetic_records: yields `count` session records, one every ~6 hours ending now
+def synthetic_records(count, seed=0):
+    rng = random.Random(seed)
+    start = time.time() - count * 6 * 3600
+    for i in range(count):
+        yield {
+            "timestamp": start + i * 6 * 3600,
+            "wpm": rng.randint(20, 120),
+            "accuracy": round(rng.uniform(80, 100), 2),
+            "mistakes": rng.randint(0, 20)
+        }
+
+
+# bench_store: compares the JSON log and the SQLite store on saves and history queries at several history sizes
+def bench_store(args):
+    cwd = os.getcwd()
+    session = engine.Session("benchmark", start_ns=0)
+    for char in "benchmark":
+        engine.process_key(session, char, 2_000_000_000)
+
+    print(f"{'backend':>8} {'sessions':>9} {'save ms':>9} {'stats ms':>9} {'last 10 ms':>11} {'range ms':>9} {'best ms':>9}")
+    for count in args.counts:
+        for backend in ("log", "sqlite"):
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                engine.STORAGE_BACKEND = backend
+                try:
+                    if backend == "log":
+                        with open(engine.SESSION_LOG, "w") as f:
+                            for record in synthetic_records(count):
+                                f.write(json.dumps(record) + "\n")
+                        engine.rebuild_summary()
+                    else:
+                        conn, _ = sqlite_store.connect(engine.DB_FILE)
+                        sqlite_store.import_sessions(conn, synthetic_records(count))
+
+                    # the last 1% of the history, e.g. "this month" for a long-time user
+                    end = time.time()
+                    start = end - count * 6 * 3600 // 100
+                    timings = [
+                        time_call(lambda: engine.save_session(session), args.repeat),
+                        time_call(engine.get_progress_stats, args.repeat),
+                        time_call(lambda: engine.get_recent_sessions(10), args.repeat),
+                        time_call(lambda: engine.get_sessions_between(start, end), args.repeat),
+                        time_call(lambda: engine.get_best_in_range(start, end), args.repeat),
+                    ]
+                finally:
+                    sqlite_store.close()
+                    os.chdir(cwd)
+
+            print(f"{backend:>8} {count:>9} " + " ".join(f"{ms:>{w}.3f}" for ms, w in zip(timings, (9, 9, 11, 9, 9))))
+
+
+# synthetic_history: yields `per_day` session records a day for `years` years, ending now
+def synthetic_history(years, per_day, seed=0):
+    rng = random.Random(seed)
+    count = int(years * 365 * per_day)
+    start = time.time() - years * 365 * 86400
+    for i in range(count):
+        yield {
+            "timestamp": start + i * 86400 / per_day,
+            "wpm": rng.randint(20, 120),
+            "accuracy": round(rng.uniform(80, 100), 2),
+            "mistakes": rng.randint(0, 20)
+        }
+
+
+# bench_history: cold history load and progress stats as years of sessions accumulate, raw vs compacted
+def bench_history(args):
+    cwd = os.getcwd()
+
+    # cold: the running totals are recomputed (log) and load_sessions parses everything stored
+    def load():
+        if engine.STORAGE_BACKEND == "log" and os.path.exists(engine.SUMMARY_FILE):
+            os.remove(engine.SUMMARY_FILE)
+        engine.load_sessions()
+        return engine.get_progress_stats()
+
+    print(f"{'backend':>8} {'years':>6} {'sessions':>9} {'raw ms':>8} {'compact s':>10} {'stored':>7} {'compacted ms':>13} {'same':>5}")
+    for backend in ("log", "sqlite"):
+        for years in args.years:
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                engine.STORAGE_BACKEND = backend
+                try:
+                    records = list(synthetic_history(years, args.per_day))
+                    if backend == "log":
+                        with open(engine.SESSION_LOG, "w") as f:
+                            for record in records:
+                                f.write(json.dumps(record) + "\n")
+                    else:
+                        conn, _ = sqlite_store.connect(engine.DB_FILE)
+                        sqlite_store.import_sessions(conn, records)
+
+                    before = load()
+                    raw_ms = time_call(load, args.repeat)
+
+                    start = time.perf_counter()
+                    engine.compact_history(args.raw_days, args.daily_days)
+                    compact_s = time.perf_counter() - start
+
+                    after = load()
+                    compacted_ms = time_call(load, args.repeat)
+                    stored = len(engine.load_sessions()) + len(engine.load_rollups())
+                finally:
+                    sqlite_store.close()
+                    os.chdir(cwd)
+
+            print(f"{backend:>8} {years:>6} {len(records):>9} {raw_ms:>8.2f} {compact_s:>10.2f} {stored:>7} "
+                  f"{compacted_ms:>13.2f} {str(before == after):>5}")
+
+
+# check_writer: asserts that SessionWriter.submit returns at once while a save is blocked on disk, that flush()
+# waits for the save and drains once it is released, and that a steady stream is written in max_pending batches
+def check_writer(session):
+    release = threading.Event()
+    batches = []
+
+    def blocked_save(records):
+        release.wait(10)
+        batches.append(len(records))
+
+    with mock.patch.object(engine, "save_records", blocked_save):
+        writer = persistence.SessionWriter(flush_delay=0.01)
+        try:
+            writer.submit(session)
+            time.sleep(0.1)                 # the worker is now inside the blocked save
+
+            start = time.perf_counter()
+            for _ in range(3):
+                writer.submit(session)
+            submit_ms = (time.perf_counter() - start) * 1000
+            assert submit_ms < 50, f"submit waited {submit_ms:.1f} ms on a blocked save"
+
+            flusher = threading.Thread(target=writer.flush)
+            flusher.start()
+            flusher.join(0.2)
+            assert flusher.is_alive(), "flush returned before the blocked save finished"
+
+            release.set()
+            flusher.join(5)
+            assert not flusher.is_alive(), "flush did not return after the save was released"
+            assert sum(batches) == 4, f"{sum(batches)} of 4 sessions saved"
+        finally:
+            release.set()
+            writer.close()
+
+    batches.clear()
+    with mock.patch.object(engine, "save_records", blocked_save):
+        # with a long flush delay, only the batch cap can end a batch
+        writer = persistence.SessionWriter(max_pending=4, flush_delay=5)
+        try:
+            start = time.perf_counter()
+            for _ in range(4):
+                writer.submit(session)
+            while not batches and time.perf_counter() - start < 2:
+                time.sleep(0.01)
+            assert batches == [4], f"a full batch was not written promptly (batches {batches})"
+        finally:
+            writer.close()
+
+
+# bench_persist: time the UI thread spends finishing a test, saving directly vs handing off to the background writer
+def bench_persist(args):
+    cwd = os.getcwd()
+    session = engine.Session("benchmark", start_ns=0)
+    for char in "benchmark":
+        engine.process_key(session, char, 2_000_000_000)
+
+    check_writer(session)
+    print("writer check: submit does not wait on a blocked save, flush drains, batches are capped")
+    if args.check_only:
+        return
+
+    print(f"{'backend':>8} {'save':>7} {'p50 us':>9} {'p99 us':>9} {'max us':>9} {'drain ms':>9}")
+    for backend in ("log", "sqlite"):
+        for mode in ("direct", "writer"):
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                engine.STORAGE_BACKEND = backend
+                try:
+                    with open(engine.SESSION_LOG, "w") as f:
+                        for record in synthetic_records(args.history):
+                            f.write(json.dumps(record) + "\n")
+                    engine.rebuild_summary()
+                    engine.get_progress_stats()
+
+                    writer = persistence.SessionWriter() if mode == "writer" else None
+                    latencies = []
+                    for _ in range(args.count):
+                        start = time.perf_counter_ns()
+                        if writer is None:
+                            engine.save_session(session)
+                        else:
+                            writer.submit(session)
+                        latencies.append(time.perf_counter_ns() - start)
+
+                    start = time.perf_counter()
+                    if writer is not None:
+                        writer.close()
+                    drain_ms = (time.perf_counter() - start) * 1000
+                finally:
+                    sqlite_store.close()
+                    os.chdir(cwd)
+
+            summary = replay.summarize_latencies(latencies)
+            print(f"{backend:>8} {mode:>7} {summary['p50_us']:>9.1f} {summary['p99_us']:>9.1f} "
+                  f"{summary['max_us']:>9.1f} {drain_ms:>9.1f}")
+
+
+# write_synthetic_traces: records `count` synthetic typo-heavy sessions as keystroke traces in directory
+def write_synthetic_traces(directory, count, length):
+    target_text = source_text(length)
+    for i in range(count):
+        session = engine.Session(target_text, start_ns=0)
+        session.trace = keytrace.TraceWriter(os.path.join(directory, f"{i}{keytrace.TRACE_SUFFIX}"), target_text)
+        for key, now_ns in replay.synthetic_stream(target_text, "typos", seed=i):
+            engine.process_key(session, key, now_ns)
+        engine.close_trace(session)
+
+
+# bench_score: measures batch re-scoring throughput as the worker count grows
+def bench_score(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        write_synthetic_traces(tmp, args.count, args.length)
+
+        print(f"{'workers':>8} {'seconds':>9} {'sessions/s':>11} {'speedup':>8}")
+        first = None
+        for workers in args.workers:
+            with open(os.devnull, "w", newline="") as out:
+                start = time.perf_counter()
+                score.score_directory(tmp, out, workers, args.chunksize)
+                elapsed = time.perf_counter() - start
+
+            # speedup is relative to the first worker count in the list
+            first = first or elapsed
+            print(f"{workers:>8} {elapsed:>9.3f} {args.count / elapsed:>11.1f} {first / elapsed:>8.2f}")
+
+
+# time_curses_startup: returns seconds from launching main.py in a pseudo-terminal until the start screen is drawn
+def time_curses_startup(timeout=10):
+    import pty
+    import select
+    import signal
+    import subprocess
+
+    primary, secondary = pty.openpty()
+    env = dict(os.environ, TERM=os.environ.get("TERM", "xterm"))
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "main.py"], stdin=secondary, stdout=secondary, stderr=secondary,
+                               env=env, start_new_session=True)
+    os.close(secondary)
+
+    output = b""
+    try:
+        while b"Press any key to begin" not in output:
+            remaining = timeout - (time.perf_counter() - start)
+            if remaining <= 0 or not select.select([primary], [], [], remaining)[0]:
+                return None
+            try:
+                output += os.read(primary, 4096)
+            except OSError:
+                return None
+        return time.perf_counter() - start
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait()
+        os.close(primary)
+
+
+# time_gui_startup: returns seconds from launching gui.py until its first frame is drawn (None if it cannot start)
+def time_gui_startup(timeout=30):
+    import subprocess
+    try:
+        import gui
+    except ImportError:
+        # no Tk in this Python, so gui.py cannot start either
+        return None
+
+    env = dict(os.environ, **{gui.FIRST_FRAME_ENV: "1"})
+    start = time.perf_counter()
+    try:
+        result = subprocess.run([sys.executable, "gui.py"], env=env, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None
+    if result.returncode != 0 or "ready" not in result.stdout:
+        return None
+    return time.perf_counter() - start
+
+
+# bench_startup: times process launch to first interactive frame for both front ends and writes the results as JSON
+def bench_startup(args):
+    results = {}
+    for name, measure in (("curses", time_curses_startup), ("gui", time_gui_startup)):
+        timings = []
+        for _ in range(args.repeat):
+            elapsed = measure()
+            if elapsed is None:
+                break
+            timings.append(elapsed)
+
+        if not timings:
+            print(f"{name:>7}  could not start (missing dependency or display?)")
+            continue
+
+        timings.sort()
+        results[name] = {"runs": len(timings), "median_ms": round(timings[len(timings) // 2] * 1000, 1),
+                         "min_ms": round(timings[0] * 1000, 1), "max_ms": round(timings[-1] * 1000, 1)}
+        print(f"{name:>7}  median {results[name]['median_ms']:>8.1f} ms  min {results[name]['min_ms']:>8.1f} ms  "
+              f"max {results[name]['max_ms']:>8.1f} ms")
+
+    with open(args.out, "w") as f:
+        json.dump({
+            "benchmark": "startup",
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results
+        }, f, indent=2)
+    print(f"Wrote {args.out}")
+
+
+# main: parses the command line and runs the chosen benchmark
+def main():
+    parser = argparse.ArgumentParser(description="Typing test performance benchmarks")
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+
+    corpus_parser = benchmarks.add_parser("corpus", help="session start: readlines() vs line-offset index")
+    corpus_parser.add_argument("--max-size", default="1G", help="largest synthetic corpus to generate (default 1G)")
+    corpus_parser.add_argument("--repeat", type=int, default=100, help="passage selections timed per corpus")
+    corpus_parser.set_defaults(func=bench_corpus)
+
+    memory_parser = benchmarks.add_parser("memory", help="memory held by a typed session: dict vs engine.Session")
+    memory_parser.add_argument("--lengths", type=int, nargs="+", default=[1000, 10000, 100000],
+                               help="target text lengths to type")
+    memory_parser.set_defaults(func=bench_memory)
+
+    keys_parser = benchmarks.add_parser("keys", help="headless per-key latency of process_key and the analytics")
+    keys_parser.add_argument("--lengths", type=int, nargs="+", default=[1000, 100000], help="target text lengths")
+    keys_parser.add_argument("--profiles", nargs="+", choices=replay.STREAM_PROFILES, default=list(replay.STREAM_PROFILES),
+                             help="synthetic stream styles to replay")
+    keys_parser.add_argument("--seed", type=int, default=0, help="random seed for the synthetic streams")
+    keys_parser.add_argument("--out", default="bench_keys.json", help="JSON results file (default bench_keys.json)")
+    keys_parser.set_defaults(func=bench_keys)
+
+    sketch_parser = benchmarks.add_parser("sketch", help="delay histograms vs exact delay lists: quantile error and memory")
+    sketch_parser.add_argument("--keys", type=int, nargs="+", default=[1000, 100000, 1000000], help="keystrokes per run")
+    sketch_parser.add_argument("--min-samples", type=int, default=100, help="samples a character needs to be checked")
+    sketch_parser.add_argument("--seed", type=int, default=0, help="random seed for the delays")
+    sketch_parser.set_defaults(func=bench_sketch)
+
+    render_parser = benchmarks.add_parser("render", help="Tk typing-screen handler time: re-insert vs tag ranges")
+    render_parser.add_argument("--lengths", type=int, nargs="+", default=[100, 1000, 5000], help="target text lengths")
+    render_parser.add_argument("--keys", type=int, default=300, help="keystrokes timed per length")
+    render_parser.add_argument("--seed", type=int, default=0, help="random seed for the keystroke stream")
+    render_parser.set_defaults(func=bench_render)
+
+    viewport_parser = benchmarks.add_parser("viewport", help="per-key cost of the scrolling window vs passage length")
+    viewport_parser.add_argument("--lengths", type=int, nargs="+", default=[1000, 100000, 1000000], help="passage lengths")
+    viewport_parser.add_argument("--keys", type=int, default=2000, help="keystrokes timed per length")
+    viewport_parser.add_argument("--width", type=int, default=70, help="characters per line")
+    viewport_parser.add_argument("--height", type=int, default=viewport.VIEW_LINES, help="lines shown")
+    viewport_parser.add_argument("--seed", type=int, default=0, help="random seed for the keystroke stream")
+    viewport_parser.set_defaults(func=bench_viewport)
+
+    adaptive_parser = benchmarks.add_parser("adaptive", help="adaptive line selection: matrix build and pick time")
+    adaptive_parser.add_argument("--lines", type=int, nargs="+", default=[10000, 100000, 1000000], help="corpus sizes")
+    adaptive_parser.add_argument("--repeat", type=int, default=50, help="picks timed per corpus")
+    adaptive_parser.add_argument("--seed", type=int, default=0, help="random seed for the corpus and picks")
+    adaptive_parser.set_defaults(func=bench_adaptive)
+
+    ingest_parser = benchmarks.add_parser("ingest", help="corpus ingestion: throughput and peak memory by input size")
+    ingest_parser.add_argument("--max-size", default="16M", help="largest synthetic book, e.g. 256M")
+    ingest_parser.add_argument("--dedupe-mb", type=int, default=16, help="duplicate filter size")
+    ingest_parser.add_argument("--seed", type=int, default=0, help="random seed for the synthetic book")
+    ingest_parser.set_defaults(func=bench_ingest)
+
+    store_parser = benchmarks.add_parser("store", help="session history: JSON log vs SQLite saves and queries")
+    store_parser.add_argument("--counts", type=int, nargs="+", default=[10000, 100000, 1000000],
+                              help="history sizes to generate")
+    store_parser.add_argument("--repeat", type=int, default=5, help="calls timed per query")
+    store_parser.set_defaults(func=bench_store)
+
+    history_parser = benchmarks.add_parser("history", help="cold history load by years of sessions: raw vs compacted")
+    history_parser.add_argument("--years", type=float, nargs="+", default=[1, 2, 5, 10], help="simulated history lengths")
+    history_parser.add_argument("--per-day", type=int, default=10, help="sessions per simulated day")
+    history_parser.add_argument("--raw-days", type=int, default=engine.RAW_HISTORY_DAYS, help="days kept raw")
+    history_parser.add_argument("--daily-days", type=int, default=engine.DAILY_ROLLUP_DAYS, help="days kept as day rollups")
+    history_parser.add_argument("--repeat", type=int, default=5, help="loads timed per history")
+    history_parser.set_defaults(func=bench_history)
+
+    persist_parser = benchmarks.add_parser("persist", help="UI-thread time to save a finished test: direct vs background writer")
+    persist_parser.add_argument("--count", type=int, default=200, help="finished tests saved back to back")
+    persist_parser.add_argument("--history", type=int, default=10000, help="sessions already in the history")
+    persist_parser.add_argument("--check-only", action="store_true",
+                                help="only assert the writer never blocks the UI thread and caps its batches (fast)")
+    persist_parser.set_defaults(func=bench_persist)
+
+    score_parser = benchmarks.add_parser("score", help="batch re-scoring throughput by worker count")
+    score_parser.add_argument("--count", type=int, default=2000, help="synthetic recordings to score")
+    score_parser.add_argument("--length", type=int, default=1000, help="characters per recording")
+    score_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()],
+                              help="worker counts to try")
+    score_parser.add_argument("--chunksize", type=int, default=64, help="recordings handed to a worker at a time")
+    score_parser.set_defaults(func=bench_score)
+
+    startup_parser = benchmarks.add_parser("startup", help="process launch to first interactive frame (curses and Tk)")
+    startup_parser.add_argument("--repeat", type=int, default=10, help="launches timed per front end")
+    startup_parser.add_argument("--out", default="bench_startup.json", help="JSON results file (default bench_startup.json)")
+    startup_parser.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
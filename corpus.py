@@ -0,0 +1,180 @@
+# Name: corpus.py
+# Description: Line-offset index over a text corpus so a random passage can be read without loading the whole file
+# Author: Sanika Surose
+
+import hashlib
+import os
+import random
+import struct
+import sys
+from array import array
+
+# constants
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"TTIDX2\0\0"
+INDEX_HEADER = struct.Struct("<8sqqq16s")  # magic, corpus mtime_ns, corpus size, line count, tail hash
+TAIL_BYTES = 4096                          # bytes before the indexed size that must be unchanged for an append
+OFFSET = struct.Struct("<Q")               # byte offset of one non-blank line
+WRITE_CHUNK = 65536                        # offsets buffered before each index write
+BUCKET_DIR = "corpus"                      # difficulty-bucketed corpus written by ingest.py
+DIFFICULTIES = ("easy", "medium", "hard")
+
+
+# index_path: returns the sidecar index path for a corpus file
+def index_path(corpus_path):
+    return corpus_path + INDEX_SUFFIX
+
+
+# bucket_path: returns the corpus file holding one difficulty bucket
+def bucket_path(bucket_dir, difficulty):
+    return os.path.join(bucket_dir, difficulty + ".txt")
+
+
+# tail_hash: returns a digest of the TAIL_BYTES of the corpus just before `size`, used to recognise appends
+def tail_hash(corpus_path, size):
+    with open(corpus_path, "rb") as corpus:
+        corpus.seek(max(0, size - TAIL_BYTES))
+        return hashlib.blake2b(corpus.read(size - corpus.tell()), digest_size=16).digest()
+
+
+# is_append: returns True if the corpus is now the `size` bytes whose tail hashed to `digest`, plus whole new lines
+def is_append(corpus_path, size, digest):
+    stat = os.stat(corpus_path)
+    if stat.st_size <= size:
+        return False
+    with open(corpus_path, "rb") as corpus:
+        corpus.seek(max(0, size - 1))
+        # the last indexed line must have been complete, or the append changed it
+        if size and corpus.read(1) != b"\n":
+            return False
+    return tail_hash(corpus_path, size) == digest
+
+
+# _write_offsets: appends the offset of every non-blank line from byte `offset` on; returns how many were written
+def _write_offsets(corpus, index, offset):
+    count = 0
+    corpus.seek(offset)
+    offsets = array("Q")
+    for line in corpus:
+        if line.strip():
+            offsets.append(offset)
+        offset += len(line)
+
+        if len(offsets) >= WRITE_CHUNK:
+            count += len(offsets)
+            index.write(_offset_bytes(offsets))
+            offsets = array("Q")
+
+    count += len(offsets)
+    index.write(_offset_bytes(offsets))
+    return count
+
+
+# build_index: streams the corpus once and writes the offset of every non-blank line to the sidecar index
+def build_index(corpus_path):
+    stat = os.stat(corpus_path)
+    path = index_path(corpus_path)
+    tmp_path = path + ".tmp"
+
+    with open(corpus_path, "rb") as corpus, open(tmp_path, "wb") as index:
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, 0, 0, 0, bytes(16)))
+        count = _write_offsets(corpus, index, 0)
+
+        # header is written last so a half-built index never looks valid
+        index.seek(0)
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, stat.st_mtime_ns, stat.st_size, count,
+                                      tail_hash(corpus_path, stat.st_size)))
+
+    os.replace(tmp_path, path)
+    return count
+
+
+# extend_index: indexes only the lines appended since the index was built; returns the new line count
+def extend_index(corpus_path, size, count):
+    stat = os.stat(corpus_path)
+    with open(corpus_path, "rb") as corpus, open(index_path(corpus_path), "r+b") as index:
+        # offsets past the header's count are left over from an interrupted extend; overwrite them
+        index.seek(INDEX_HEADER.size + count * OFFSET.size)
+        index.truncate()
+        count += _write_offsets(corpus, index, size)
+        index.flush()
+
+        index.seek(0)
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, stat.st_mtime_ns, stat.st_size, count,
+                                      tail_hash(corpus_path, stat.st_size)))
+    return count
+
+
+# _offset_bytes: returns the offsets as little-endian bytes, matching OFFSET
+def _offset_bytes(offsets):
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+# _read_header: returns (mtime_ns, size, count, tail hash) from an index file, or None if it is missing or invalid
+def _read_header(path):
+    try:
+        with open(path, "rb") as f:
+            data = f.read(INDEX_HEADER.size)
+    except OSError:
+        return None
+
+    if len(data) != INDEX_HEADER.size:
+        return None
+
+    magic, mtime_ns, size, count, digest = INDEX_HEADER.unpack(data)
+    if magic != INDEX_MAGIC:
+        return None
+    return mtime_ns, size, count, digest
+
+
+# ensure_index: returns the number of indexed lines, extending the index if lines were appended to the corpus
+# and rebuilding it if the corpus changed in any other way since it was built
+def ensure_index(corpus_path):
+    stat = os.stat(corpus_path)
+    header = _read_header(index_path(corpus_path))
+
+    if header is None:
+        return build_index(corpus_path)
+    mtime_ns, size, count, digest = header
+    if mtime_ns == stat.st_mtime_ns and size == stat.st_size:
+        return count
+    if is_append(corpus_path, size, digest):
+        return extend_index(corpus_path, size, count)
+    return build_index(corpus_path)
+
+
+# read_line: returns line number `line_id` (0-based, blank lines excluded) from the corpus, stripped
+def read_line(corpus_path, line_id):
+    with open(index_path(corpus_path), "rb") as index:
+        index.seek(INDEX_HEADER.size + line_id * OFFSET.size)
+        (offset,) = OFFSET.unpack(index.read(OFFSET.size))
+
+    with open(corpus_path, "rb") as corpus:
+        corpus.seek(offset)
+        return corpus.readline().decode("utf-8").strip()
+
+
+# iter_lines: yields every non-blank corpus line from byte `start` on, stripped, in line-id order (streams the file)
+def iter_lines(corpus_path, start=0):
+    with open(corpus_path, "rb") as corpus:
+        corpus.seek(start)
+        for line in corpus:
+            if line.strip():
+                yield line.decode("utf-8").strip()
+
+
+# random_line: returns one random non-blank line from the corpus using the index (constant memory)
+def random_line(corpus_path):
+    count = ensure_index(corpus_path)
+    if count == 0:
+        raise ValueError(f"{corpus_path} has no text to type")
+
+    return read_line(corpus_path, random.randrange(count))
+
+
+# read_passage: returns a whole text file (e.g. a book chapter) as one passage, with line breaks and runs of spaces collapsed
+def read_passage(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return " ".join(f.read().split())
@@ -0,0 +1,219 @@
+# Name: drills.py
+# Description: Inverted index from characters and bigrams to corpus lines, used to build weak-key practice drills
+# Author: Sanika Surose
+
+import heapq
+import os
+import random
+import struct
+import sys
+from array import array
+from collections import Counter
+from itertools import islice
+import corpus
+
+# constants
+NGRAM_SUFFIX = ".ngrams"
+NGRAM_MAGIC = b"TTNGR1\0\0"
+NGRAM_HEADER = struct.Struct("<8sqqq16sI")  # magic, corpus mtime_ns, corpus size, line count, corpus tail hash, grams
+GRAM_HEADER = struct.Struct("<BH")          # gram length in bytes, postings stored for it
+POSTINGS_SCANNED = 200                      # densest lines kept per gram; all a drill ever scores
+MAX_COUNT = 65535                           # counts and line lengths are stored as uint16
+DRILL_CHOICES = 5                           # a drill picks randomly among this many best lines so drills vary
+
+# loaded index per corpus path, kept for the life of the process
+_indexes = {}
+
+
+# ngram_path: returns the sidecar n-gram index path for a corpus file
+def ngram_path(corpus_path):
+    return corpus_path + NGRAM_SUFFIX
+
+
+# line_grams: returns the character and bigram counts of one line
+def line_grams(line):
+    grams = Counter(line)
+    grams.update(line[i:i + 2] for i in range(len(line) - 1))
+    return grams
+
+
+# _empty_index: returns an index over no lines; postings are gram -> (line ids, counts, line lengths) arrays,
+# the POSTINGS_SCANNED densest lines only, densest first. Line ids are the corpus .idx line ids.
+def _empty_index():
+    return {
+        "mtime_ns": 0,
+        "size": 0,
+        "lines": 0,
+        "tail": bytes(16),
+        "postings": {}
+    }
+
+
+# _heap: returns a gram's stored postings as a min-heap of (density, -line id, count, length)
+def _heap(postings):
+    if postings is None:
+        return []
+    heap = [(count / length, -line_id, count, length) for line_id, count, length in zip(*postings)]
+    heapq.heapify(heap)
+    return heap
+
+
+# _add_lines: merges lines (numbered from first_id) into the postings, keeping the densest POSTINGS_SCANNED per gram;
+# only the grams of the new lines are touched
+def _add_lines(postings, lines, first_id):
+    heaps = {}
+    for line_id, line in enumerate(lines, first_id):
+        length = min(len(line), MAX_COUNT)
+        for gram, count in line_grams(line).items():
+            heap = heaps.get(gram)
+            if heap is None:
+                heap = heaps[gram] = _heap(postings.get(gram))
+
+            count = min(count, MAX_COUNT)
+            entry = (count / length, -line_id, count, length)
+            if len(heap) < POSTINGS_SCANNED:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    for gram, heap in heaps.items():
+        heap.sort(reverse=True)
+        postings[gram] = (
+            array("I", [-entry[1] for entry in heap]),
+            array("H", [entry[2] for entry in heap]),
+            array("H", [entry[3] for entry in heap])
+        )
+
+
+# _le_bytes: returns an array as little-endian bytes
+def _le_bytes(values):
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+# _save_index: writes the index (bounded by grams x POSTINGS_SCANNED, whatever the corpus size) through a temp file
+def _save_index(corpus_path, index):
+    tmp_path = ngram_path(corpus_path) + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(NGRAM_HEADER.pack(NGRAM_MAGIC, index["mtime_ns"], index["size"], index["lines"], index["tail"],
+                                  len(index["postings"])))
+        for gram, (ids, counts, lengths) in index["postings"].items():
+            data = gram.encode("utf-8")
+            f.write(GRAM_HEADER.pack(len(data), len(ids)) + data)
+            f.write(_le_bytes(ids) + _le_bytes(counts) + _le_bytes(lengths))
+    os.replace(tmp_path, ngram_path(corpus_path))
+
+
+# _read_index: returns the index saved for a corpus, or None if it is missing or invalid
+def _read_index(corpus_path):
+    try:
+        with open(ngram_path(corpus_path), "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < NGRAM_HEADER.size:
+        return None
+
+    magic, mtime_ns, size, lines, tail, gram_count = NGRAM_HEADER.unpack_from(data)
+    if magic != NGRAM_MAGIC:
+        return None
+
+    postings = {}
+    position = NGRAM_HEADER.size
+    try:
+        for _ in range(gram_count):
+            gram_length, stored = GRAM_HEADER.unpack_from(data, position)
+            position += GRAM_HEADER.size
+            gram = data[position:position + gram_length].decode("utf-8")
+            position += gram_length
+
+            arrays = []
+            for typecode in ("I", "H", "H"):
+                values = array(typecode)
+                end = position + stored * values.itemsize
+                values.frombytes(data[position:end])
+                if sys.byteorder == "big":
+                    values.byteswap()
+                arrays.append(values)
+                position = end
+            postings[gram] = tuple(arrays)
+    except (struct.error, ValueError, UnicodeDecodeError):
+        return None
+
+    return {"mtime_ns": mtime_ns, "size": size, "lines": lines, "tail": tail, "postings": postings}
+
+
+# update_index: brings the n-gram index up to date with the corpus; lines appended since it was built cost
+# O(new lines), any other change rebuilds it
+def update_index(corpus_path, index=None):
+    count = corpus.ensure_index(corpus_path)
+    stat = os.stat(corpus_path)
+
+    if index is None or index["lines"] > count or not corpus.is_append(corpus_path, index["size"], index["tail"]):
+        index = _empty_index()
+
+    lines = corpus.iter_lines(corpus_path, index["size"])
+    _add_lines(index["postings"], islice(lines, count - index["lines"]), index["lines"])
+    lines.close()
+
+    index.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size, lines=count,
+                 tail=corpus.tail_hash(corpus_path, stat.st_size))
+    _save_index(corpus_path, index)
+    return index
+
+
+# load_index: returns the n-gram index for a corpus, loading it once per process and updating it if the corpus changed
+def load_index(corpus_path):
+    stat = os.stat(corpus_path)
+    index = _indexes.get(corpus_path)
+    if index is None:
+        index = _read_index(corpus_path)
+
+    if index is None or index["mtime_ns"] != stat.st_mtime_ns or index["size"] != stat.st_size:
+        index = update_index(corpus_path, index)
+
+    _indexes[corpus_path] = index
+    return index
+
+
+# rank_lines: returns [(score, line id), ...] for the lines densest in the weighted grams, best first
+#   weak_keys is {char or bigram: weight} or a list of grams (weight 1 each)
+def rank_lines(corpus_path, weak_keys, limit=DRILL_CHOICES):
+    if not isinstance(weak_keys, dict):
+        weak_keys = {gram: 1 for gram in weak_keys}
+
+    postings = load_index(corpus_path)["postings"]
+
+    scores = {}
+    for gram, weight in weak_keys.items():
+        if gram not in postings:
+            continue
+        for line_id, count, length in zip(*postings[gram]):
+            scores[line_id] = scores.get(line_id, 0.0) + weight * count / length
+
+    best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [(score, line_id) for line_id, score in best]
+
+
+# generate_drill: returns practice text dense in the weak keys, about `length` characters long (None if no line has them)
+def generate_drill(corpus_path, weak_keys, length=0):
+    ranked = rank_lines(corpus_path, weak_keys, DRILL_CHOICES + length // 40)
+    if not ranked:
+        return None
+
+    # one random pick from the best lines, then more of the best lines until the drill is long enough
+    line_ids = [line_id for _, line_id in ranked]
+    first = random.choice(line_ids[:DRILL_CHOICES])
+    parts = [corpus.read_line(corpus_path, first)]
+    total = len(parts[0])
+
+    for line_id in line_ids:
+        if total >= length:
+            break
+        if line_id != first:
+            parts.append(corpus.read_line(corpus_path, line_id))
+            total += len(parts[-1]) + 1
+
+    return " ".join(parts)
@@ -2,85 +2,338 @@
 # Description: Contains the code related to analyzing typing, separated from printing it (main.py)
 # Author: Sanika Surose
 
-import random
+import argparse
+import heapq
 import time
 import json
 import os
+import threading
+from array import array
+from contextlib import contextmanager
+import corpus
+import drills
+import keytrace
+import sketch
+import sqlite_store
+
+try:
+    import fcntl
+except ImportError:         # no flock on Windows; there the log is only guarded within one process
+    fcntl = None
 
 # constants
-SESSION_FILE = "sessions.json"
-
-
-# create_session: initializes and returns a new typing test session dictionary with all states
-def create_session():
-    return {
-        "target_text": load_text(),
-        "current_text": [],
-        "start_time": time.time(),
-        "finished": False,
-        "mistakes": 0,
-        "total_keystrokes": 0, 
-
-        # v1.2.0 analytics
-        "char_errors": {},      
-        "char_timings": {}, 
-        "last_key_time": None
-    }
-
-# load_text: loads target text from text.txt file
-def load_text():
-	with open("text.txt", "r") as f:
-		lines = f.readlines()
-		return random.choice(lines).strip()
+SESSION_FILE = "sessions.json"              # legacy v2.0.0 history (one JSON array), migrated on first use
+SESSION_LOG = "sessions.jsonl"              # append-only history, one JSON record per line
+SUMMARY_FILE = "summary.json"               # running totals over the session log, updated on every save
+CHAR_STATS_FILE = "char_stats.json"         # all-time per-character totals, merged on every save
+LOCK_FILE = "sessions.lock"                 # flock'd by every process that writes or compacts the session log
+TEXT_FILE = "text.txt"                      # corpus of target passages, one per line
+TRACE_ENV = "TYPING_TEST_TRACE"             # set to 1 to record a keystroke trace for every session
+DB_FILE = "sessions.db"                     # SQLite history, used instead of the log when STORAGE_BACKEND is "sqlite"
+STORAGE_BACKEND = os.environ.get("TYPING_TEST_STORAGE", "log")
+RECORD_FIELDS = ("timestamp", "wpm", "accuracy", "mistakes")   # what the history stores for each session
+ERROR_RATE_MIN_ATTEMPTS = 5                 # attempts at a character before its error rate counts (adaptive practice, weak keys)
+SLOW_KEY_MIN_DELAYS = 5                     # timed presses of a character before it can be called slow
+RAW_HISTORY_DAYS = 90                       # compact_history keeps sessions younger than this as raw records
+DAILY_ROLLUP_DAYS = 365                     # and per-day rollups younger than this; older days are merged into weeks
+ROLLUP_FIELDS = ("period", "start", "count", "wpm_sum", "wpm_max", "accuracy_sum", "mistakes_sum")
+SECONDS_PER_DAY = 86400
+
+# serializes writes to the session store (the GUI and curses app save from a background thread, see persistence.py)
+_store_lock = threading.RLock()
+_log_lock_depth = 0                         # nesting of _log_lock in this process, changed under _store_lock
+
+
+# _log_lock: holds _store_lock and an exclusive flock on LOCK_FILE, so a save from another process (e.g. a second
+# app window) cannot append between compaction reading the log and replacing it; re-entrant within a process
+@contextmanager
+def _log_lock():
+    global _log_lock_depth
+    with _store_lock:
+        if fcntl is None or _log_lock_depth:
+            _log_lock_depth += 1
+            try:
+                yield
+            finally:
+                _log_lock_depth -= 1
+            return
+
+        with open(LOCK_FILE, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            _log_lock_depth += 1
+            try:
+                yield
+            finally:
+                _log_lock_depth -= 1
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# per-character states, stored as one byte per target character
+UNTYPED, CORRECT, INCORRECT = 0, 1, 2
+STATE_NAMES = ("untyped", "correct", "incorrect")
+NON_CHAR_KEY = 0xFFFD                       # codepoint recorded for multi-character keys such as "KEY_LEFT"
+
+# live WPM over the last few seconds, from a fixed ring of keystroke timestamps
+LIVE_WPM_WINDOW = 10                        # seconds covered by calculate_live_wpm
+LIVE_WPM_KEYS = 256                         # timestamps kept; enough for ~300 WPM over the whole window
+
+
+class Session:
+    """
+    State of one typing test. Attributes are fixed with __slots__, keystrokes are kept in compact
+    arrays and all timing uses the monotonic perf_counter_ns clock. Dict-style access
+    (session["mistakes"], session["current_text"], ...) keeps working for older callers.
+    """
+    __slots__ = (
+        "target_text", "typed", "start_ns", "end_ns", "last_key_ns", "finished", "mistakes", "total_keystrokes",
+        "char_attempts", "char_errors", "delays", "char_delays",
+        "char_states", "state_changes", "key_times", "key_head", "key_tail", "trace"
+    )
+
+    # __init__: starts a session for the given target text (start_ns lets replays inject the clock)
+    def __init__(self, target_text, start_ns=None):
+        self.target_text = target_text
+        self.typed = array("I")                 # codepoints typed so far (backspace pops)
+        self.start_ns = time.perf_counter_ns() if start_ns is None else start_ns
+        self.end_ns = None                      # set when the last character is typed; freezes the WPM
+        self.last_key_ns = None
+        self.finished = False
+        self.mistakes = 0
+        self.total_keystrokes = 0
+
+        # v1.2.0 analytics: attempts and mistakes per expected character
+        self.char_attempts = {}
+        self.char_errors = {}
+
+        # inter-key delays as fixed-size histograms, overall and per expected character (see sketch.py)
+        self.delays = sketch.DelayHistogram()
+        self.char_delays = {}
+
+        # incremental rendering: per-index state plus the indices changed since the last read
+        self.char_states = bytearray(len(target_text))
+        self.state_changes = {}
+
+        # live WPM: ring of typed-character timestamps; head and tail only grow, slot = count % LIVE_WPM_KEYS
+        self.key_times = array("q", bytes(8 * LIVE_WPM_KEYS))
+        self.key_head = 0
+        self.key_tail = 0
+
+        # optional keytrace.TraceWriter, see create_session
+        self.trace = None
+
+    # current_text: returns the typed text as a string
+    def current_text(self):
+        return "".join(map(chr, self.typed))
+
+    # char_timings: returns {expected char: [delays in seconds]} rebuilt from the histograms
+    # (each delay is its bucket's estimate, within sketch.RELATIVE_ACCURACY, grouped by bucket rather than in typing order)
+    def char_timings(self):
+        return {char: histogram.values() for char, histogram in self.char_delays.items()}
+
+    # ---- dict-style compatibility ----
+    def __getitem__(self, key):
+        if key in _SESSION_VIEWS:
+            return _SESSION_VIEWS[key](self)
+        if key in Session.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in Session.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in _SESSION_VIEWS or key in Session.__slots__
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+# keys from the old session dict that are now computed from the compact fields
+_SESSION_VIEWS = {
+    "current_text": Session.current_text,
+    "char_timings": Session.char_timings,
+    "char_states": lambda s: [STATE_NAMES[state] for state in s.char_states],
+    "start_time": lambda s: s.start_ns / 1e9,
+    "last_key_time": lambda s: None if s.last_key_ns is None else s.last_key_ns / 1e9,
+}
+
+
+# create_session: initializes and returns a new typing test session with all states (random text unless target_text is given)
+# record_trace writes every keystroke to traces/ (defaults to the TYPING_TEST_TRACE environment variable);
+# adaptive picks a passage heavy in the characters the user mistypes most, see load_adaptive_text
+def create_session(record_trace=None, target_text=None, adaptive=False, difficulty=None):
+    if target_text is None:
+        target_text = load_adaptive_text(difficulty) if adaptive else load_text(difficulty)
+    session = Session(target_text)
+
+    if record_trace is None:
+        record_trace = os.environ.get(TRACE_ENV) == "1"
+    if record_trace:
+        session.trace = keytrace.TraceWriter(keytrace.new_trace_path(), session.target_text)
+
+    return session
+
+# create_drill_session: starts a practice session on text dense in the given weak keys ({char or bigram: weight}),
+# e.g. create_drill_session(dict(get_weak_keys(last_session))); falls back to a random line
+def create_drill_session(weak_keys, length=0, record_trace=None):
+    target_text = drills.generate_drill(TEXT_FILE, weak_keys, length)
+    return create_session(record_trace, target_text)
+
+# close_trace: flushes and closes the session's keystroke trace, if it is recording one
+def close_trace(session):
+    if session.trace is not None:
+        session.trace.close()
+        session.trace = None
+
+# text_file: returns the corpus to draw lines from: text.txt, or one difficulty bucket built by ingest.py
+def text_file(difficulty=None):
+    if difficulty is None:
+        return TEXT_FILE
+    if difficulty not in corpus.DIFFICULTIES:
+        raise ValueError(f"unknown difficulty {difficulty!r}, expected one of {corpus.DIFFICULTIES}")
+    return corpus.bucket_path(corpus.BUCKET_DIR, difficulty)
+
+# text_file_problem: returns why a difficulty's corpus cannot be typed from (missing or empty), or None if it can
+def text_file_problem(difficulty):
+    path = text_file(difficulty)
+    if not os.path.exists(path):
+        return f"no {path}; build it first with: python ingest.py BOOK.txt"
+    if corpus.ensure_index(path) == 0:
+        return f"{path} has no sentences; ingest more text with: python ingest.py BOOK.txt"
+    return None
+
+# parse_args: parses the command line shared by main.py and gui.py; exits with a usage error if the chosen
+# difficulty bucket cannot be typed from
+def parse_args():
+    parser = argparse.ArgumentParser(description="Speed typing test")
+    parser.add_argument("passage", nargs="?", help="text file to type instead of a random line, e.g. a book chapter")
+    parser.add_argument("--adaptive", action="store_true", help="pick lines heavy in the characters you mistype most")
+    parser.add_argument("--difficulty", choices=corpus.DIFFICULTIES, help="draw lines from a corpus bucket built by ingest.py")
+    args = parser.parse_args()
+
+    problem = text_file_problem(args.difficulty) if args.difficulty else None
+    if problem:
+        parser.error(problem)
+    return args
+
+# load_text: loads a random target text from the corpus through its line-offset index
+def load_text(difficulty=None):
+    return corpus.random_line(text_file(difficulty))
+
+# load_adaptive_text: loads a line scored against the user's per-character error rates (random until there are any)
+def load_adaptive_text(difficulty=None):
+    error_rates = get_char_error_rates()
+    if error_rates:
+        # adaptive pulls in NumPy; import it only when adaptive practice is used
+        import adaptive
+
+        line = adaptive.pick_line(text_file(difficulty), error_rates)
+        if line is not None:
+            return line
+    return load_text(difficulty)
 
 # process_key: updates session state based on the given key input (handles typing and backspace)
-def process_key(session, key):
+# now_ns overrides the perf_counter_ns clock, for replaying recorded keystrokes
+def process_key(session, key, now_ns=None):
 
-    now = time.time()
+    now = time.perf_counter_ns() if now_ns is None else now_ns
 
     # timing analytics
-    if session["last_key_time"] is not None: 
-        delay = now - session["last_key_time"]
+    if session.last_key_ns is not None: 
+        delay_ns = now - session.last_key_ns
     else: 
-        delay = None
-
-    session["last_key_time"] = now
-
-    if key in ("KEY_BACKSPACE", "\b", "\x7f"):
-        if session["current_text"]:
-            session["current_text"].pop()
+        delay_ns = None
+
+    typed = session.typed
+    is_backspace = key in ("KEY_BACKSPACE", "\b", "\x7f")
+
+    if session.trace is not None:
+        previous = session.last_key_ns if session.last_key_ns is not None else session.start_ns
+        expected_code = ord(session.target_text[len(typed)]) if len(typed) < len(session.target_text) else 0
+        typed_code = 0 if is_backspace else (ord(key) if len(key) == 1 else NON_CHAR_KEY)
+        session.trace.write(now - previous, typed_code, expected_code, is_backspace)
+
+    session.last_key_ns = now
+
+    if is_backspace:
+        if typed:
+            typed.pop()
+            _set_char_state(session, len(typed), UNTYPED)
+            # the live rate counts net characters, like calculate_wpm
+            if session.key_head > session.key_tail:
+                session.key_head -= 1
         return 
 
-    if len(session["current_text"]) >= len(session["target_text"]):
+    target_text = session.target_text
+    if len(typed) >= len(target_text):
         return 
 
-    expected = session["target_text"][len(session["current_text"])]
-    session["current_text"].append(key)
-    session["total_keystrokes"] += 1
+    expected = target_text[len(typed)]
+    typed.append(ord(key) if len(key) == 1 else NON_CHAR_KEY)
+    session.total_keystrokes += 1
+    session.char_attempts[expected] = session.char_attempts.get(expected, 0) + 1
+
+    session.key_times[session.key_head % LIVE_WPM_KEYS] = now
+    session.key_head += 1
+    if session.key_head - session.key_tail > LIVE_WPM_KEYS:
+        session.key_tail += 1
 
     # record timing per character 
-    if delay is not None: 
-        session["char_timings"].setdefault(expected, []).append(delay)
+    if delay_ns is not None: 
+        delay = delay_ns / 1e9
+        session.delays.add(delay)
+        char_delays = session.char_delays.get(expected)
+        if char_delays is None:
+            char_delays = session.char_delays[expected] = sketch.DelayHistogram()
+        char_delays.add(delay)
 
     # mistake tracking
     if key != expected: 
-        session["mistakes"] += 1
-        session["char_errors"][expected] = session["char_errors"].get(expected, 0) + 1
-
-    if len(session["current_text"]) == len(session["target_text"]):
-        session["finished"] = True
-
-# calculate_wpm: calculates the wpm for the current session
-def calculate_wpm(session):
-    elapsed = max(time.time() - session["start_time"], 1)
-    return round((len(session["current_text"]) / (elapsed / 60)) / 5)
+        session.mistakes += 1
+        session.char_errors[expected] = session.char_errors.get(expected, 0) + 1
+        _set_char_state(session, len(typed) - 1, INCORRECT)
+    else:
+        _set_char_state(session, len(typed) - 1, CORRECT)
+
+    if len(typed) == len(target_text):
+        session.finished = True
+        session.end_ns = now
+        close_trace(session)
+
+# calculate_wpm: calculates the wpm for the current session (up to the last key once it is finished)
+def calculate_wpm(session, now_ns=None):
+    if now_ns is None:
+        now_ns = session.end_ns if session.end_ns is not None else time.perf_counter_ns()
+    elapsed = max((now_ns - session.start_ns) / 1e9, 1)
+    return round((len(session.typed) / (elapsed / 60)) / 5)
+
+# calculate_live_wpm: returns the WPM over the last LIVE_WPM_WINDOW seconds in amortized O(1)
+# (expired timestamps are dropped from the ring as the window moves past them)
+def calculate_live_wpm(session, now_ns=None):
+    if now_ns is None:
+        now_ns = session.end_ns if session.end_ns is not None else time.perf_counter_ns()
+
+    times = session.key_times
+    cutoff = now_ns - LIVE_WPM_WINDOW * 1_000_000_000
+    while session.key_tail < session.key_head and times[session.key_tail % LIVE_WPM_KEYS] < cutoff:
+        session.key_tail += 1
+    count = session.key_head - session.key_tail
+
+    # the window is shorter at the start of a test, and ends at the oldest kept key once the ring is full
+    span_ns = min(now_ns - session.start_ns, LIVE_WPM_WINDOW * 1_000_000_000)
+    if count == LIVE_WPM_KEYS:
+        span_ns = now_ns - times[session.key_tail % LIVE_WPM_KEYS]
+    elapsed = max(span_ns / 1e9, 1)
+    return round((count / (elapsed / 60)) / 5)
 
 # calculate_accuracy: calculates and returns the typing accuracy percentage for the current session
 def calculate_accuracy(session):
-    if session["total_keystrokes"] == 0:
+    if session.total_keystrokes == 0:
         return 100.0
-    correct = session["total_keystrokes"] - session["mistakes"]
-    return round((correct / session["total_keystrokes"]) * 100, 2)
+    correct = session.total_keystrokes - session.mistakes
+    return round((correct / session.total_keystrokes) * 100, 2)
 
 # build_char_states: decides if current character user is typing is correct or not
 def build_char_states(target_text, current_text): 
@@ -97,25 +350,51 @@ def build_char_states(target_text, current_text):
 
     return char_states
 
+# _set_char_state: records a state change for one index of the target text
+def _set_char_state(session, index, state):
+    old_state = session.char_states[index]
+    if old_state == state:
+        return
+
+    session.char_states[index] = state
+
+    # keep the state the index had at the last read so repeated edits coalesce
+    changes = session.state_changes
+    first_state = changes.get(index, old_state)
+    if first_state == state:
+        del changes[index]
+    else:
+        changes[index] = first_state
+
+# pop_state_changes: returns (index, old_state, new_state) for every index changed since the last call
+def pop_state_changes(session):
+    changes = session.state_changes
+    states = session.char_states
+    result = [(i, STATE_NAMES[old_state], STATE_NAMES[states[i]]) for i, old_state in changes.items()]
+    changes.clear()
+    return result
+
 # analytics helpers (for version v1.2.0)
 # get_top_mistakes: returns the top 5 characters where users made most mistakes
 def get_top_mistakes(session, limit=5): 
     return sorted(
-        session["char_errors"].items(),
+        session.char_errors.items(),
         key=lambda x: x[1],
         reverse=True
     )[:limit]
 
 # get_average_key_delay: calculates and returns the average delay (in seconds) between key presses for the current session
 def get_average_key_delay(session): 
-    delays = []
-    for times in session["char_timings"].values(): 
-        delays.extend(times)
+    return round(session.delays.mean, 3)
 
-    if not delays: 
-        return 0.0
-
-    return round(sum(delays) / len(delays), 3)
+# get_key_delay_percentiles: returns the median, p90 and p99 delay (seconds) for the session or one expected character
+def get_key_delay_percentiles(session, char=None):
+    delays = session.delays if char is None else session.char_delays.get(char, sketch.DelayHistogram())
+    return {
+        "p50": round(delays.quantile(0.5), 3),
+        "p90": round(delays.quantile(0.9), 3),
+        "p99": round(delays.quantile(0.99), 3)
+    }
 
 # get_performance_profile: classifies overall typing performance based on WPM and accuracy
 def get_performance_profile(session):
@@ -133,7 +412,7 @@ def get_performance_profile(session):
 
 # get_weak_keys: returns the most frequently mistyped characters
 def get_weak_keys(session, limit=3):
-    errors = session.get("char_errors", {})
+    errors = session.char_errors
     if not errors:
         return []
 
@@ -141,17 +420,11 @@ def get_weak_keys(session, limit=3):
 
 # get_speed_feedback: analyzes typing consistency using key delay variance
 def get_speed_feedback(session):
-    delays = []
-    for times in session.get("char_timings", {}).values():
-        delays.extend(times)
-
-    if len(delays) < 5:
+    delays = session.delays
+    if delays.count < 5:
         return "Not enough data"
 
-    avg = sum(delays) / len(delays)
-    variance = sum((d - avg) ** 2 for d in delays) / len(delays)
-
-    if variance < 0.01:
+    if delays.variance() < 0.01:
         return "Consistent typing speed"
     else:
         return "Inconsistent typing speed"
@@ -171,49 +444,532 @@ def get_actionable_tip(session):
         return "Practice common word patterns and transitions"
 
 
-# load_sessions: loads and returns the list of all saved typing test sessions from file
-def load_sessions():
-    if not os.path.exists(SESSION_FILE):
-        return []
+# _migrate_legacy_sessions: imports records from the old sessions.json array into the session log (runs once)
+def _migrate_legacy_sessions():
+    if os.path.exists(SESSION_LOG) or not os.path.exists(SESSION_FILE):
+        return
+
     with open(SESSION_FILE, "r") as f:
         try:
-            return json.load(f)
+            sessions = json.load(f)
         except json.JSONDecodeError:
-            # File is empty or corrupt; treat as no sessions
-            return []
+            # File is empty or corrupt; nothing to import
+            sessions = []
+
+    # write to a temp file first so a crash cannot leave a half-migrated log behind
+    tmp_path = SESSION_LOG + ".tmp"
+    with open(tmp_path, "w") as f:
+        for record in sessions:
+            f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, SESSION_LOG)
+    os.replace(SESSION_FILE, SESSION_FILE + ".bak")
+
+
+# _iter_log_records: streams every record in the session log (rollups first, then sessions), skipping a truncated
+# trailing record
+def _iter_log_records():
+    _migrate_legacy_sessions()
+    if not os.path.exists(SESSION_LOG):
+        return
+
+    with open(SESSION_LOG, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # a crash mid-append leaves at most one partial line; keep everything else
+                continue
+
+
+# _iter_log_sessions: streams the raw typing test sessions saved in the session log
+def _iter_log_sessions():
+    return (record for record in _iter_log_records() if "period" not in record)
+
+
+# _iter_log_rollups: streams the per-day/per-week rollups compact_history wrote at the head of the session log
+def _iter_log_rollups():
+    for record in _iter_log_records():
+        if "period" not in record:
+            break
+        yield record
+
+
+# _db: returns the process-wide SQLite connection, importing the JSON history when the database is first created
+def _db():
+    conn, created = sqlite_store.connect(DB_FILE)
+    if created:
+        sqlite_store.import_sessions(conn, _iter_log_sessions())
+        sqlite_store.import_rollups(conn, _iter_log_rollups())
+        sqlite_store.merge_char_stats(conn, _read_char_stats_file())
+    return conn
+
+
+# migrate_to_sqlite: copies the JSON session history into sessions.db; returns the number of sessions imported
+def migrate_to_sqlite():
+    conn, created = sqlite_store.connect(DB_FILE)
+    if not created and sqlite_store.progress_stats(conn)[0]:
+        raise ValueError(f"{DB_FILE} already has sessions; refusing to import them twice")
+    if not sqlite_store.char_stats(conn):
+        sqlite_store.merge_char_stats(conn, _read_char_stats_file())
+    sqlite_store.import_rollups(conn, _iter_log_rollups())
+    return sqlite_store.import_sessions(conn, _iter_log_sessions())
+
+
+# iter_sessions: streams the raw saved typing test sessions from the configured store, oldest first
+# (sessions folded into rollups by compact_history are not included)
+def iter_sessions():
+    if STORAGE_BACKEND == "sqlite":
+        return sqlite_store.iter_sessions(_db())
+    return _iter_log_sessions()
+
+
+# _rollup_row: returns a rollup as one row at the period's mean WPM, accuracy and mistakes, timestamped mid-period
+def _rollup_row(rollup):
+    count = rollup["count"]
+    days = 7 if rollup["period"] == "week" else 1
+    return (rollup["start"] + days * SECONDS_PER_DAY / 2, rollup["wpm_sum"] / count,
+            rollup["accuracy_sum"] / count, rollup["mistakes_sum"] / count, count)
+
+
+# session_rows_since: returns (rows, cursor) for the sessions saved after `cursor` (None reads everything, rollups
+# included as _rollup_row means), or None if the history was rewritten since the cursor was taken. Rows are
+# (timestamp, wpm, accuracy, mistakes, sessions) tuples, sessions being 1 for a raw session; the cursor is
+# ("log", log generation, byte offset) or ("sqlite", compaction generation, last row id).
+def session_rows_since(cursor=None):
+    if STORAGE_BACKEND == "sqlite":
+        conn = _db()
+        generation = sqlite_store.generation(conn)
+        last_id = 0 if cursor is None else cursor[2]
+        if cursor is not None and (cursor[0] != "sqlite" or cursor[1] != generation):
+            return None
+
+        rows = []
+        if cursor is None:
+            rows.extend(_rollup_row(rollup) for rollup in sqlite_store.rollups(conn))
+        new_rows = sqlite_store.rows_after(conn, last_id)
+        if new_rows:
+            last_id = new_rows[-1][0]
+        rows.extend(tuple(row)[1:] + (1,) for row in new_rows)
+        return rows, ("sqlite", generation, last_id)
+
+    # the generation and the open file are taken together, so a compaction cannot slip in between them
+    with _log_lock():
+        generation = load_summary().get("generation", 0)
+        if not os.path.exists(SESSION_LOG):
+            return ([], ("log", generation, 0)) if cursor is None else None
+        f = open(SESSION_LOG, "rb")
+
+    rows = []
+    with f:
+        if cursor is None:
+            offset = 0
+        elif cursor[0] != "log" or cursor[1] != generation or cursor[2] > os.fstat(f.fileno()).st_size:
+            return None
+        else:
+            offset = cursor[2]
+
+        f.seek(offset)
+        for line in f:
+            # a record without its newline is still being written (or was truncated); read it next time
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "period" in record:
+                rows.append(_rollup_row(record))
+            else:
+                rows.append((record["timestamp"], record["wpm"], record["accuracy"], record["mistakes"], 1))
+
+    return rows, ("log", generation, offset)
+
+
+# load_sessions: loads and returns the list of the raw saved typing test sessions
+def load_sessions():
+    return list(iter_sessions())
 
 
-# save_session: saves the current typing test session summary to the sessions file
-def save_session(session):
-    sessions = load_sessions()
+# load_rollups: returns the per-day/per-week rollups written by compact_history, oldest first
+def load_rollups():
+    if STORAGE_BACKEND == "sqlite":
+        return sqlite_store.rollups(_db())
+    return list(_iter_log_rollups())
+
+
+# _append_records: appends JSON records to the session log with a single fsync; returns the new log size
+def _append_records(records):
+    with _log_lock():
+        _migrate_legacy_sessions()
+
+        with open(SESSION_LOG, "ab") as f:
+            # a previous crash may have left a partial line; start the record on a fresh one
+            if f.tell() > 0:
+                with open(SESSION_LOG, "rb") as tail:
+                    tail.seek(-1, os.SEEK_END)
+                    if tail.read(1) != b"\n":
+                        f.write(b"\n")
+
+            lines = (json.dumps({field: record[field] for field in RECORD_FIELDS}) + "\n" for record in records)
+            f.write("".join(lines).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+
+# _write_json_atomic: writes data to path through a temp file so readers never see a partial file
+def _write_json_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# _empty_summary: returns running totals for an empty history
+def _empty_summary():
+    return {
+        "count": 0,
+        "wpm_sum": 0,
+        "accuracy_sum": 0.0,
+        "best_wpm": None,
+        "log_size": 0,
+        "generation": 0
+    }
+
+
+# _add_to_summary: folds one session record into the running totals
+def _add_to_summary(summary, record):
+    summary["count"] += 1
+    summary["wpm_sum"] += record["wpm"]
+    summary["accuracy_sum"] += record["accuracy"]
+    if summary["best_wpm"] is None or record["wpm"] > summary["best_wpm"]:
+        summary["best_wpm"] = record["wpm"]
+
+
+# _add_rollup_to_summary: folds one per-day/per-week rollup (many sessions) into the running totals
+def _add_rollup_to_summary(summary, rollup):
+    summary["count"] += rollup["count"]
+    summary["wpm_sum"] += rollup["wpm_sum"]
+    summary["accuracy_sum"] += rollup["accuracy_sum"]
+    if summary["best_wpm"] is None or rollup["wpm_max"] > summary["best_wpm"]:
+        summary["best_wpm"] = rollup["wpm_max"]
+
+
+# _log_size: returns the size in bytes of the session log (0 if there is none yet)
+def _log_size():
+    try:
+        return os.path.getsize(SESSION_LOG)
+    except OSError:
+        return 0
+
+
+# rebuild_summary: recomputes the running totals from the session log (rollups and raw sessions) and saves them
+def rebuild_summary():
+    with _log_lock():
+        summary = _empty_summary()
+        for record in _iter_log_records():
+            if "period" in record:
+                _add_rollup_to_summary(summary, record)
+            else:
+                _add_to_summary(summary, record)
+
+        summary["log_size"] = _log_size()
+        # the log no longer matched its summary, so it may have been rewritten: start a generation no cursor holds
+        summary["generation"] = time.time_ns()
+        _write_json_atomic(SUMMARY_FILE, summary)
+        return summary
+
+
+# load_summary: returns the running totals, rebuilding them if they no longer match the session log
+def load_summary():
+    with _store_lock:
+        _migrate_legacy_sessions()
+        try:
+            with open(SUMMARY_FILE, "r") as f:
+                summary = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return rebuild_summary()
+
+        # the summary records the log size it covers; any other size means a write was missed
+        if summary.get("log_size") != _log_size():
+            return rebuild_summary()
+
+        return summary
 
-    record = {
+
+# session_record: returns the summary record saved for a typing test session; "chars" (see session_char_stats)
+# is merged into the per-character totals and is not written to the history
+def session_record(session):
+    return {
         "timestamp": time.time(),
         "wpm": calculate_wpm(session),
         "accuracy": calculate_accuracy(session),
-        "mistakes": session["mistakes"]
+        "mistakes": session.mistakes,
+        "chars": session_char_stats(session)
     }
 
-    sessions.append(record)
 
-    with open(SESSION_FILE, "w") as f:
-        json.dump(sessions, f, indent=2)
+# session_char_stats: returns {char: [attempts, errors, delay_count, delay_sum, delay_sumsq]} for one session
+# (delays in seconds), the form the per-character totals are kept in
+def session_char_stats(session):
+    stats = {}
+    for char, attempts in session.char_attempts.items():
+        delays = session.char_delays.get(char) or sketch.DelayHistogram()
+        stats[char] = [attempts, session.char_errors.get(char, 0), delays.count, delays.total, delays.total_sq]
+    return stats
+
+
+# _merge_char_stats: adds per-character totals into `totals` in place
+def _merge_char_stats(totals, stats):
+    for char, values in stats.items():
+        current = totals.get(char)
+        if current is None:
+            totals[char] = list(values)
+        else:
+            for i, value in enumerate(values):
+                current[i] += value
+
+
+# _read_char_stats_file: returns the per-character totals saved next to the session log ({} before the first save)
+def _read_char_stats_file():
+    try:
+        with open(CHAR_STATS_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+# load_char_stats: returns the all-time per-character totals, {char: [attempts, errors, delay_count, delay_sum, delay_sumsq]};
+# one small table, so this does not grow with the history
+def load_char_stats():
+    with _store_lock:
+        if STORAGE_BACKEND == "sqlite":
+            return sqlite_store.char_stats(_db())
+        return _read_char_stats_file()
+
+
+# get_char_error_rates: returns {char: errors / attempts} for characters mistyped at least once
+# in ERROR_RATE_MIN_ATTEMPTS or more attempts
+def get_char_error_rates():
+    return {
+        char: errors / attempts for char, (attempts, errors, *_) in load_char_stats().items()
+        if errors and attempts >= ERROR_RATE_MIN_ATTEMPTS
+    }
+
+
+# get_all_time_weak_keys: returns [(char, error rate %)] for the characters mistyped most often across all sessions
+def get_all_time_weak_keys(limit=3):
+    rates = sorted(get_char_error_rates().items(), key=lambda x: x[1], reverse=True)[:limit]
+    return [(char, round(rate * 100, 1)) for char, rate in rates]
+
+
+# get_all_time_slowest_keys: returns [(char, average delay in seconds)] for the characters typed slowest across all sessions
+def get_all_time_slowest_keys(limit=3):
+    delays = [
+        (char, delay_sum / delay_count) for char, (_, _, delay_count, delay_sum, _) in load_char_stats().items()
+        if delay_count >= SLOW_KEY_MIN_DELAYS
+    ]
+    delays.sort(key=lambda x: x[1], reverse=True)
+    return [(char, round(delay, 3)) for char, delay in delays[:limit]]
+
+
+# save_records: appends session records to the configured store in one write (safe to call from a worker thread)
+def save_records(records):
+    if not records:
+        return
+
+    char_stats = {}
+    for record in records:
+        _merge_char_stats(char_stats, record.get("chars", {}))
+
+    if STORAGE_BACKEND == "sqlite":
+        with _store_lock:
+            conn = _db()
+            sqlite_store.import_sessions(conn, records)
+            sqlite_store.merge_char_stats(conn, char_stats)
+        return
+
+    with _log_lock():
+        summary = load_summary()
+        log_size = _append_records(records)
+
+        for record in records:
+            _add_to_summary(summary, record)
+        summary["log_size"] = log_size
+        _write_json_atomic(SUMMARY_FILE, summary)
+
+        totals = _read_char_stats_file()
+        _merge_char_stats(totals, char_stats)
+        _write_json_atomic(CHAR_STATS_FILE, totals)
+
+
+# save_session: saves the current typing test session summary to the session log
+def save_session(session):
+    save_records([session_record(session)])
 
 
 # get_progress_stats: computes and returns summary statistics about the user's typing progress across all sessions
 def get_progress_stats():
-    sessions = load_sessions()
-    if not sessions:
+    if STORAGE_BACKEND == "sqlite":
+        total, best_wpm, avg_wpm, avg_acc = sqlite_store.progress_stats(_db())
+        if not total:
+            return None
+        return {
+            "total_tests": total,
+            "best_wpm": best_wpm,
+            "avg_wpm": round(avg_wpm, 1),
+            "avg_accuracy": round(avg_acc, 1)
+        }
+
+    summary = load_summary()
+    if not summary["count"]:
         return None
 
-    total = len(sessions)
-    best_wpm = max(s["wpm"] for s in sessions)
-    avg_wpm = round(sum(s["wpm"] for s in sessions) / total, 1)
-    avg_acc = round(sum(s["accuracy"] for s in sessions) / total, 1)
+    total = summary["count"]
+    best_wpm = summary["best_wpm"]
+    avg_wpm = round(summary["wpm_sum"] / total, 1)
+    avg_acc = round(summary["accuracy_sum"] / total, 1)
 
     return {
         "total_tests": total,
         "best_wpm": best_wpm,
         "avg_wpm": avg_wpm,
         "avg_accuracy": avg_acc
-    }
\ No newline at end of file
+    }
+
+
+# get_recent_sessions: returns the last `limit` raw saved sessions by timestamp, oldest first
+def get_recent_sessions(limit=10):
+    if STORAGE_BACKEND == "sqlite":
+        return sqlite_store.recent_sessions(_db(), limit)
+
+    return sorted(heapq.nlargest(limit, iter_sessions(), key=lambda s: s["timestamp"]), key=lambda s: s["timestamp"])
+
+
+# get_sessions_between: returns the raw saved sessions with start <= timestamp <= end, oldest first
+def get_sessions_between(start, end):
+    if STORAGE_BACKEND == "sqlite":
+        return sqlite_store.sessions_between(_db(), start, end)
+
+    sessions = [s for s in iter_sessions() if start <= s["timestamp"] <= end]
+    return sorted(sessions, key=lambda s: s["timestamp"])
+
+
+# get_best_in_range: returns the highest-WPM raw session with start <= timestamp <= end, or None
+def get_best_in_range(start, end):
+    if STORAGE_BACKEND == "sqlite":
+        return sqlite_store.best_in_range(_db(), start, end)
+
+    sessions = get_sessions_between(start, end)
+    return max(sessions, key=lambda s: s["wpm"]) if sessions else None
+
+
+# _period_start: returns the local-time start of the day, or of the week (from Monday), containing a timestamp
+def _period_start(timestamp, period):
+    t = time.localtime(timestamp)
+    days_back = t.tm_wday if period == "week" else 0
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday - days_back, 0, 0, 0, 0, 0, -1))
+
+
+# _fold_rollup: adds a session or a finer rollup into its `period` rollup in rollups, {(period, start): rollup}
+def _fold_rollup(rollups, period, record):
+    if "period" in record:
+        start = _period_start(record["start"], period)
+        totals = [record[field] for field in ROLLUP_FIELDS[2:]]
+    else:
+        start = _period_start(record["timestamp"], period)
+        totals = [1, record["wpm"], record["wpm"], record["accuracy"], record["mistakes"]]
+
+    rollup = rollups.get((period, start))
+    if rollup is None:
+        rollups[(period, start)] = dict(zip(ROLLUP_FIELDS, [period, start] + totals))
+        return
+    rollup["count"] += totals[0]
+    rollup["wpm_sum"] += totals[1]
+    rollup["wpm_max"] = max(rollup["wpm_max"], totals[2])
+    rollup["accuracy_sum"] += totals[3]
+    rollup["mistakes_sum"] += totals[4]
+
+
+# _compact_records: splits history records into (raw sessions kept, rollups oldest first, records folded): sessions
+# before raw_cutoff go into day rollups (week rollups before day_cutoff), and day rollups before day_cutoff into weeks
+def _compact_records(records, raw_cutoff, day_cutoff):
+    kept = []
+    rollups = {}
+    folded = 0
+    for record in records:
+        if "period" in record:
+            if record["period"] == "day" and record["start"] < day_cutoff:
+                _fold_rollup(rollups, "week", record)
+                folded += 1
+            else:
+                _fold_rollup(rollups, record["period"], record)
+        elif record["timestamp"] < raw_cutoff:
+            _fold_rollup(rollups, "week" if record["timestamp"] < day_cutoff else "day", record)
+            folded += 1
+        else:
+            kept.append(record)
+
+    return kept, sorted(rollups.values(), key=lambda rollup: (rollup["start"], rollup["period"])), folded
+
+
+# _compact_log: rewrites the session log as rollups followed by the kept sessions, replacing it in one rename
+def _compact_log(raw_cutoff, day_cutoff):
+    with _log_lock():
+        summary = load_summary()
+        kept, rollups, folded = _compact_records(_iter_log_records(), raw_cutoff, day_cutoff)
+        if not folded:
+            return 0
+
+        tmp_path = SESSION_LOG + ".tmp"
+        with open(tmp_path, "w") as f:
+            for rollup in rollups:
+                f.write(json.dumps(rollup) + "\n")
+            for record in kept:
+                f.write(json.dumps({field: record[field] for field in RECORD_FIELDS}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, SESSION_LOG)
+
+        # the totals are unchanged; only the log size they cover moves. A rename can hand the new log the inode
+        # of an older one, so the generation is what tells trends cursors the log was rewritten
+        summary["log_size"] = _log_size()
+        summary["generation"] = summary.get("generation", 0) + 1
+        _write_json_atomic(SUMMARY_FILE, summary)
+        return folded
+
+
+# compact_history: rolls sessions older than raw_days into per-day rollups and days older than daily_days into
+# per-week rollups (count, WPM sum and max, accuracy and mistake sums), so the stored history stays bounded.
+# Progress totals and best WPM are unchanged; per-character totals are already aggregated and are not touched.
+# Returns the number of sessions and day rollups folded.
+def compact_history(raw_days=RAW_HISTORY_DAYS, daily_days=DAILY_ROLLUP_DAYS, now=None):
+    if now is None:
+        now = time.time()
+    # cutoffs fall on period boundaries, so no day or week is split between raw records and a rollup
+    raw_cutoff = _period_start(now - raw_days * SECONDS_PER_DAY, "day")
+    day_cutoff = min(_period_start(now - daily_days * SECONDS_PER_DAY, "week"), _period_start(raw_cutoff, "week"))
+
+    if STORAGE_BACKEND != "sqlite":
+        with _log_lock():
+            _migrate_legacy_sessions()
+            if not os.path.exists(SESSION_LOG):
+                return 0
+            return _compact_log(raw_cutoff, day_cutoff)
+
+    with _store_lock:
+
+        conn = _db()
+        records = load_rollups() + sqlite_store.sessions_before(conn, raw_cutoff)
+        _, rollups, folded = _compact_records(records, raw_cutoff, day_cutoff)
+        if folded:
+            sqlite_store.compact(conn, raw_cutoff, rollups)
+        return folded
@@ -2,10 +2,14 @@
 # Description: Contains the graphical user interface code for the typing test application
 # Author: Sanika Surose
 
-from re import T
-import customtkinter as ctk
+import os
 import tkinter as tk
+import corpus
 import engine
+import instrument
+import persistence
+import tktext
+import viewport
 
 """
 Tkinter Notes: 
@@ -13,62 +17,92 @@ Tkinter Notes:
 - command ==> how you specify that a certain button/action has an associated function that gets called when you press it
 """
 
-# -- App Config ---
-ctk.set_appearance_mode("dark")                                     # set the appearance mode to dark (tuple of different colors)
-ctk.set_default_color_theme("dark-blue")                            # set the default color theme to dark-blue
+# customtkinter is imported by main() so that importing this module (for tooling and benchmarks) stays cheap
+ctk = None
+
+# constants
+FIRST_FRAME_ENV = "TYPING_TEST_EXIT_AFTER_FIRST_FRAME"     # set to 1 to print "ready" and quit once the first frame is drawn
+TEXT_WIDTH = 70                                             # characters per line of the typing display
 
 
 class TypingTest: 
     """
     App controller; owns the window and switches between screens
     """
-    # __init__: initializes the main application window and creates all screen components
-    def __init__(self): 
+    # __init__: initializes the main application window; screens are created the first time they are shown
+    # passage_text replaces the random line in every test; adaptive picks lines by the user's mistakes;
+    # difficulty draws lines from one bucket of the ingested corpus
+    def __init__(self, passage_text=None, adaptive=False, difficulty=None): 
+        self.passage_text = passage_text
+        self.adaptive = adaptive
+        self.difficulty = difficulty
         self.root = ctk.CTk()                                       
         self.root.title("Typing Test v2.0.0")                       
         self.root.geometry("900x500")
 
-        # Screens
-        self.start_screen = StartScreen(self)
-        self.typing_screen = TypingScreen(self)
-        self.results_screen = ResultsScreen(self)
-        self.progress_screen = ProgressScreen(self)
+        # Screens, keyed by class
+        self.screens = {}
 
         self.show_start()
 
         self.root.focus_force()
-        self.start_screen.start_button.focus_set()
+        self.screen(StartScreen).start_button.focus_set()
+
+        # startup benchmark hook (bench.py startup): report the first idle moment after the first frame
+        if os.environ.get(FIRST_FRAME_ENV) == "1":
+            self.root.after_idle(self._report_first_frame)
+
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         self.root.mainloop()
 
+    # close: writes any queued sessions, then closes the window
+    def close(self):
+        persistence.shutdown()
+        self.root.destroy()
+
+    # screen: returns the screen of the given class, building it on first use
+    def screen(self, screen_class):
+        screen = self.screens.get(screen_class)
+        if screen is None:
+            screen = self.screens[screen_class] = screen_class(self)
+        return screen
+
     # show_start: shows the start screen
     def show_start(self): 
         self._hide_all()
-        self.start_screen.show()
+        self.screen(StartScreen).show()
 
     # show_typing: shows the typing screen
     def show_typing(self): 
         self._hide_all()
-        self.typing_screen.start_test()
-        self.typing_screen.show()
+        typing_screen = self.screen(TypingScreen)
+        typing_screen.start_test()
+        typing_screen.show()
 
     # show_results: shows the results screen
     def show_results(self, session): 
         self._hide_all()
-        self.results_screen.load_session(session)
-        self.results_screen.show()
+        results_screen = self.screen(ResultsScreen)
+        results_screen.load_session(session)
+        results_screen.show()
 
     # show_progress: shows the progress screen
     def show_progress(self):
         self._hide_all()
-        self.progress_screen.refresh()
-        self.progress_screen.show()
+        progress_screen = self.screen(ProgressScreen)
+        progress_screen.refresh()
+        progress_screen.show()
 
     # helper function to hide all
     def _hide_all(self):
-        self.start_screen.hide()
-        self.typing_screen.hide()
-        self.results_screen.hide()
-        self.progress_screen.hide()
+        for screen in self.screens.values():
+            screen.hide()
+
+    # _report_first_frame: prints "ready" once the first frame has been drawn and closes the window
+    def _report_first_frame(self):
+        self.root.update()
+        print("ready", flush=True)
+        self.root.destroy()
 
 
 class StartScreen: 
@@ -103,6 +137,7 @@ class TypingScreen:
     def __init__(self, app): 
         self.app = app
         self.session = None
+        self.view = None
 
         self.frame = ctk.CTkFrame(app.root)
 
@@ -110,7 +145,9 @@ class TypingScreen:
         self.title.pack(pady=10)
 
         # tk.Text is used because CustomTkinter does not support per-character coloring
-        self.text_display = tk.Text(self.frame, font=("Courier", 16), wrap=tk.WORD, width=70, height=5, state=tk.DISABLED)
+        # lines are wrapped by viewport.Viewport and only the visible ones are inserted, so wrap is off here
+        self.text_display = tk.Text(self.frame, font=("Courier", 16), wrap=tk.NONE, width=TEXT_WIDTH,
+                                    height=viewport.VIEW_LINES, state=tk.DISABLED)
         self.text_display.pack(pady=20)
 
         # character coloring
@@ -121,10 +158,20 @@ class TypingScreen:
         self.stats_label = ctk.CTkLabel(self.frame, text="WPM: 0", font=ctk.CTkFont(size=16))
         self.stats_label.pack(pady=10)
 
+        # live latency overlay (TYPING_TEST_PROFILE=overlay)
+        self.latency_label = ctk.CTkLabel(self.frame, text="", font=ctk.CTkFont(size=12))
+        if instrument.OVERLAY:
+            self.latency_label.pack(pady=5)
+
     # ---- Lifecycle ----
     def start_test(self):
-        self.session = engine.create_session()
-        self.update_display()
+        self.session = engine.create_session(target_text=self.app.passage_text, adaptive=self.app.adaptive,
+                                              difficulty=self.app.difficulty)
+        self.view = viewport.Viewport(self.session.target_text, TEXT_WIDTH)
+
+        # the visible lines are inserted once per test and once per scroll; keystrokes only move tags otherwise
+        tktext.load_window(self.text_display, self.view, self.session.target_text, self.session.char_states)
+        engine.pop_state_changes(self.session)
         self.update_wpm()
 
     def show(self):
@@ -150,29 +197,36 @@ class TypingScreen:
         else:
             return
 
+        timer = instrument.key_timer()
         engine.process_key(self.session, key)
-        self.update_display()
+        timer.mark("process_key")
+        self.update_display(timer)
 
         if self.session["finished"]:
-            engine.save_session(self.session)
+            persistence.save_session_async(self.session)
             self.app.show_results(self.session)
 
     # ---- UI Updates ----
-    def update_display(self):
-        states = engine.build_char_states(self.session["target_text"], self.session["current_text"])
-
-        self.text_display.config(state=tk.NORMAL)
-        self.text_display.delete("1.0", tk.END)
-
-        for char, state in states:
-            self.text_display.insert(tk.END, char, state)
+    def update_display(self, timer=instrument.NULL_TIMER):
+        changes = engine.pop_state_changes(self.session)
+        timer.mark("char_states")
+        if self.view.follow(len(self.session.typed)):
+            tktext.load_window(self.text_display, self.view, self.session.target_text, self.session.char_states)
+        else:
+            tktext.apply_window_changes(self.text_display, self.view, changes)
+        timer.mark("render")
 
-        self.text_display.config(state=tk.DISABLED)
+        # Tk redraws when idle; this callback runs once that redraw has been done
+        if instrument.ENABLED:
+            self.app.root.after_idle(timer.painted)
 
     def update_wpm(self):
         if not self.session["finished"]:
             wpm = engine.calculate_wpm(self.session)
-            self.stats_label.configure(text=f"WPM: {wpm}")
+            live_wpm = engine.calculate_live_wpm(self.session)
+            self.stats_label.configure(text=f"WPM: {wpm}  |  Last {engine.LIVE_WPM_WINDOW}s: {live_wpm}")
+            if instrument.OVERLAY:
+                self.latency_label.configure(text=instrument.overlay_text())
             self.app.root.after(500, self.update_wpm)
 
     def show_results(self):
@@ -211,6 +265,7 @@ class ResultsScreen:
         consistency = engine.get_speed_feedback(session)
         weak_keys = engine.get_weak_keys(session)
         avg_delay = engine.get_average_key_delay(session)
+        delays = engine.get_key_delay_percentiles(session)
         tip = engine.get_actionable_tip(session)
 
         weak_keys_str = ", ".join(k for k, _ in weak_keys) if weak_keys else "None"
@@ -221,7 +276,8 @@ class ResultsScreen:
             f"Profile: {profile}\n"
             f"Typing Consistency: {consistency}\n\n"
             f"Weak Keys: {weak_keys_str}\n"
-            f"Avg key delay: {avg_delay}s\n\nTip: {tip}"
+            f"Avg key delay: {avg_delay}s\n"
+            f"Key delay median / p90 / p99: {delays['p50']}s / {delays['p90']}s / {delays['p99']}s\n\nTip: {tip}"
         )
         self.body.configure(text=text)
 
@@ -255,6 +311,8 @@ class ProgressScreen:
         self.continue_button.pack(pady=30)
 
     def refresh(self):
+        # the finished test may still be on its way to disk
+        persistence.flush()
         stats = engine.get_progress_stats()
         if not stats:
             self.stats_label.configure(text="No data yet.")
@@ -266,6 +324,21 @@ class ProgressScreen:
             f"Average WPM: {stats['avg_wpm']}\n"
             f"Average Accuracy: {stats['avg_accuracy']}%"
         )
+
+        weak_keys = engine.get_all_time_weak_keys()
+        if weak_keys:
+            text += "\nAll-time Weak Keys: " + ", ".join(f"'{char}' {rate}%" for char, rate in weak_keys)
+        slow_keys = engine.get_all_time_slowest_keys()
+        if slow_keys:
+            text += "\nSlowest Keys: " + ", ".join(f"'{char}' {delay:.2f}s" for char, delay in slow_keys)
+
+        # trends pulls in NumPy; import it only when the progress screen is first refreshed
+        import trends
+
+        long_term = trends.get_trends()
+        if long_term:
+            text += "\n\n" + "\n".join(trends.format_trends(long_term))
+
         self.stats_label.configure(text=text)
 
     def show(self):
@@ -274,5 +347,24 @@ class ProgressScreen:
     def hide(self):
         self.frame.pack_forget()
 
-# Run App
-TypingTest()
\ No newline at end of file
+# main: configures CustomTkinter and runs the app (on the given passage text instead of random lines, if any)
+def main(passage_text=None, adaptive=False, difficulty=None):
+    global ctk
+    import customtkinter
+    ctk = customtkinter
+
+    # -- App Config ---
+    ctk.set_appearance_mode("dark")                                     # set the appearance mode to dark (tuple of different colors)
+    ctk.set_default_color_theme("dark-blue")                            # set the default color theme to dark-blue
+
+    try:
+        TypingTest(passage_text, adaptive, difficulty)
+    finally:
+        # Ctrl-C in the terminal ends mainloop without WM_DELETE_WINDOW
+        persistence.shutdown()
+
+
+if __name__ == "__main__":
+    args = engine.parse_args()
+
+    main(corpus.read_passage(args.passage) if args.passage else None, args.adaptive, args.difficulty)
@@ -0,0 +1,225 @@
+# Name: ingest.py
+# Description: Streams large text files (e.g. plain-text books) into a deduplicated corpus bucketed by difficulty
+# Author: Sanika Surose
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import unicodedata
+from collections import Counter
+from math import log2
+import corpus
+
+# constants
+READ_CHUNK = 1 << 20                        # characters decoded per read, so one huge line never sits in memory
+MAX_PENDING = 4096                          # characters held waiting for a sentence end before they are dropped
+MIN_LENGTH = 30                             # sentences shorter or longer than this are not typing passages
+MAX_LENGTH = 300
+DEDUPE_MB = 16                              # size of the duplicate filter; fixed however much text goes through
+DEDUPE_HASHES = 7                           # bits set per sentence in the duplicate filter
+
+# sentence ends: terminal punctuation with optional closing quotes/brackets before whitespace, or a blank line
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*(?=\s)|\n[ \t]*\n")
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "jr", "sr", "vs", "etc", "e.g", "i.e", "no", "fig", "vol", "ch"}
+
+# typographic characters with a plain keyboard equivalent; everything else non-ASCII is decomposed or dropped
+TYPEABLE = str.maketrans({
+    "‘": "'", "’": "'", "‚": "'", "‛": "'", "′": "'",
+    "“": '"', "”": '"', "„": '"', "‟": '"', "″": '"', "«": '"', "»": '"',
+    "‐": "-", "‑": "-", "‒": "-", "–": "-", "—": " - ", "―": " - ", "−": "-",
+    "æ": "ae", "Æ": "Ae", "œ": "oe", "Œ": "Oe", "ß": "ss", "ø": "o", "Ø": "O", "ł": "l", "Ł": "L",
+    "…": "...", " ": " ", " ": " ", " ": " ", " ": " ", "­": "", "﻿": "",
+})
+
+# difficulty: letters cost log2(100 / frequency %) in English text, so rare letters (q, z, x, j) weigh more
+LETTER_FREQUENCY = {
+    "e": 12.7, "t": 9.1, "a": 8.2, "o": 7.5, "i": 7.0, "n": 6.7, "s": 6.3, "h": 6.1, "r": 6.0,
+    "d": 4.3, "l": 4.0, "c": 2.8, "u": 2.8, "m": 2.4, "w": 2.4, "f": 2.2, "g": 2.0, "y": 2.0,
+    "p": 1.9, "b": 1.5, "v": 1.0, "k": 0.8, "j": 0.15, "x": 0.15, "q": 0.1, "z": 0.07
+}
+LETTER_RARITY = {letter: log2(100 / frequency) for letter, frequency in LETTER_FREQUENCY.items()}
+LETTER_RARITY.update({letter.upper(): rarity for letter, rarity in LETTER_RARITY.items()})
+SYMBOL_WEIGHT = 8                           # score added per unit of punctuation/digit/capital density
+DIFFICULTY_LIMITS = (4.6, 5.4)              # scores below the first are easy, below the second medium, the rest hard
+
+
+# read_chunks: yields the text of each file in READ_CHUNK pieces (undecodable bytes are replaced)
+def read_chunks(paths):
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            while True:
+                chunk = f.read(READ_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+        # a file boundary also ends a paragraph
+        yield "\n\n"
+
+
+# normalize: maps typographic quotes, dashes and accents to typeable ASCII; line breaks are kept for sentence splitting
+def normalize(chunks):
+    for chunk in chunks:
+        chunk = unicodedata.normalize("NFKD", chunk.translate(TYPEABLE))
+        yield chunk.encode("ascii", "ignore").decode("ascii")
+
+
+# _ends_with_abbreviation: returns True if a sentence candidate ends with a known abbreviation such as "Mr."
+def _ends_with_abbreviation(text):
+    words = text.rstrip(".!?\"')] ").rsplit(None, 1)
+    return bool(words) and words[-1].lower() in ABBREVIATIONS
+
+
+# split_sentences: yields sentences from the text stream, each with its whitespace collapsed to single spaces
+def split_sentences(chunks):
+    pending = ""
+    for chunk in chunks:
+        text = pending + chunk
+        start = 0
+        for match in SENTENCE_END.finditer(text):
+            candidate = text[start:match.end()]
+            if match.group().startswith(("\n", " ", "\t")) or not _ends_with_abbreviation(candidate):
+                sentence = " ".join(candidate.split())
+                if sentence:
+                    yield sentence
+                start = match.end()
+        pending = text[start:]
+
+        # a run of text with no sentence end (a table, a code listing) is dropped to keep memory bounded
+        if len(pending) > MAX_PENDING:
+            pending = ""
+
+    sentence = " ".join(pending.split())
+    if sentence:
+        yield sentence
+
+
+# filter_length: yields the sentences between min_length and max_length characters, made only of printable ASCII
+def filter_length(sentences, min_length=MIN_LENGTH, max_length=MAX_LENGTH):
+    for sentence in sentences:
+        if min_length <= len(sentence) <= max_length and sentence.isprintable():
+            yield sentence
+
+
+class SeenFilter:
+    """
+    Fixed-size Bloom filter of sentence hashes; a duplicate is always caught, and a new sentence is
+    taken for a duplicate only rarely (well under 1% until tens of millions of sentences per 16 MB)
+    """
+    __slots__ = ("bits", "size")
+
+    def __init__(self, megabytes=DEDUPE_MB):
+        self.bits = bytearray(megabytes * 1024 * 1024)
+        self.size = len(self.bits) * 8
+
+    # add: records a sentence; returns True if it was (probably) seen before
+    def add(self, sentence):
+        digest = hashlib.blake2b(sentence.lower().encode("ascii"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+        seen = True
+        for i in range(DEDUPE_HASHES):
+            bit = (h1 + i * h2) % self.size
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self.bits[byte] & mask:
+                seen = False
+                self.bits[byte] |= mask
+        return seen
+
+
+# dedupe: yields each sentence the first time it is seen (case-insensitive)
+def dedupe(sentences, seen):
+    for sentence in sentences:
+        if not seen.add(sentence):
+            yield sentence
+
+
+# difficulty_score: returns how hard a sentence is to type: the average rarity of its letters
+# plus the density of punctuation, digits and capitals
+def difficulty_score(sentence):
+    letters = 0
+    rarity = 0.0
+    plain = 0
+    # Counter tallies in C, so the Python loop runs once per distinct character rather than per character
+    for char, count in Counter(sentence).items():
+        if char in LETTER_RARITY:
+            letters += count
+            rarity += LETTER_RARITY[char] * count
+            if char.islower():
+                plain += count
+        elif char == " ":
+            plain += count
+
+    symbols = len(sentence) - plain
+    return (rarity / letters if letters else 0.0) + SYMBOL_WEIGHT * symbols / len(sentence)
+
+
+# score: yields (difficulty, sentence) pairs
+def score(sentences):
+    for sentence in sentences:
+        yield corpus_difficulty(difficulty_score(sentence)), sentence
+
+
+# corpus_difficulty: returns the bucket name for a difficulty score
+def corpus_difficulty(value):
+    for name, limit in zip(corpus.DIFFICULTIES, DIFFICULTY_LIMITS):
+        if value < limit:
+            return name
+    return corpus.DIFFICULTIES[-1]
+
+
+# ingest: streams the input files into one corpus file per difficulty under out_dir; returns {difficulty: sentences}
+def ingest(paths, out_dir=corpus.BUCKET_DIR, min_length=MIN_LENGTH, max_length=MAX_LENGTH, dedupe_mb=DEDUPE_MB):
+    os.makedirs(out_dir, exist_ok=True)
+    tmp_paths = {name: corpus.bucket_path(out_dir, name) + ".tmp" for name in corpus.DIFFICULTIES}
+    counts = dict.fromkeys(corpus.DIFFICULTIES, 0)
+
+    stages = read_chunks(paths)
+    stages = normalize(stages)
+    stages = split_sentences(stages)
+    stages = filter_length(stages, min_length, max_length)
+    stages = dedupe(stages, SeenFilter(dedupe_mb))
+    stages = score(stages)
+
+    outputs = {name: open(path, "w", encoding="ascii") for name, path in tmp_paths.items()}
+    try:
+        for difficulty, sentence in stages:
+            outputs[difficulty].write(sentence + "\n")
+            counts[difficulty] += 1
+    finally:
+        for f in outputs.values():
+            f.close()
+
+    # buckets are replaced only once every input has been read, then indexed for random access;
+    # a bucket with no sentences is not written, so --difficulty reports it instead of failing mid-test
+    for name, tmp_path in tmp_paths.items():
+        path = corpus.bucket_path(out_dir, name)
+        if counts[name]:
+            os.replace(tmp_path, path)
+            corpus.ensure_index(path)
+            continue
+        for stale_path in (tmp_path, path, corpus.index_path(path)):
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+    return counts
+
+
+# main: parses the command line and ingests the files
+def main():
+    parser = argparse.ArgumentParser(description="Build a difficulty-bucketed typing corpus from plain-text files")
+    parser.add_argument("files", nargs="+", help="UTF-8 text files, e.g. books")
+    parser.add_argument("--out", default=corpus.BUCKET_DIR, help=f"output directory (default {corpus.BUCKET_DIR}/)")
+    parser.add_argument("--min-length", type=int, default=MIN_LENGTH, help="shortest sentence kept (characters)")
+    parser.add_argument("--max-length", type=int, default=MAX_LENGTH, help="longest sentence kept (characters)")
+    parser.add_argument("--dedupe-mb", type=int, default=DEDUPE_MB, help="memory for the duplicate filter")
+    args = parser.parse_args()
+
+    counts = ingest(args.files, args.out, args.min_length, args.max_length, args.dedupe_mb)
+    for name in corpus.DIFFICULTIES:
+        target = corpus.bucket_path(args.out, name) if counts[name] else "not written"
+        print(f"{name:>6}: {counts[name]} sentences -> {target}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# Name: instrument.py
+# Description: Opt-in keypress-to-paint latency instrumentation with fixed-bucket histograms (TYPING_TEST_PROFILE=1)
+# Author: Sanika Surose
+
+import atexit
+import json
+import os
+import time
+
+# constants
+PROFILE_ENV = "TYPING_TEST_PROFILE"         # 1 records and dumps histograms on exit; "overlay" also shows p50/p99 live
+PROFILE_FILE = "latency_profile.json"
+STAGES = ("process_key", "char_states", "render", "refresh", "total")
+BUCKETS = 26                                # bucket i holds durations below 2**i µs; the last one everything longer
+
+ENABLED = os.environ.get(PROFILE_ENV) in ("1", "overlay")
+OVERLAY = os.environ.get(PROFILE_ENV) == "overlay"
+
+
+class Histogram:
+    """
+    Fixed power-of-two microsecond buckets; recording is a bit_length and an increment
+    """
+    __slots__ = ("counts", "count", "total_ns", "max_ns")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    # add: records one duration in nanoseconds
+    def add(self, duration_ns):
+        self.counts[min((duration_ns // 1000).bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+
+    # percentile_us: returns the upper bound (µs) of the bucket holding the p-th percentile (0-100)
+    def percentile_us(self, p):
+        if self.count == 0:
+            return 0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(2 ** i, self.max_ns / 1000)
+        return self.max_ns / 1000
+
+    # to_dict: returns the histogram as JSON-ready data
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean_us": round(self.total_ns / self.count / 1000, 3) if self.count else 0,
+            "p50_us": self.percentile_us(50),
+            "p99_us": self.percentile_us(99),
+            "max_us": round(self.max_ns / 1000, 3),
+            "bucket_upper_us": [2 ** i for i in range(BUCKETS - 1)] + [None],
+            "bucket_counts": self.counts
+        }
+
+
+# one histogram per stage for the life of the process
+HISTOGRAMS = {stage: Histogram() for stage in STAGES}
+
+
+class KeyTimer:
+    """
+    Timestamps the stages of one keypress; each mark records the time since the previous mark
+    """
+    __slots__ = ("start_ns", "last_ns")
+
+    def __init__(self):
+        self.start_ns = self.last_ns = time.perf_counter_ns()
+
+    # mark: records the time spent in `stage` since the previous mark
+    def mark(self, stage):
+        now = time.perf_counter_ns()
+        HISTOGRAMS[stage].add(now - self.last_ns)
+        self.last_ns = now
+
+    # painted: records the refresh stage and the whole input-to-paint time
+    def painted(self):
+        self.mark("refresh")
+        HISTOGRAMS["total"].add(self.last_ns - self.start_ns)
+
+
+class _NullTimer:
+    """
+    Stand-in used when instrumentation is off, so call sites cost one no-op method call
+    """
+    __slots__ = ()
+
+    def mark(self, stage):
+        pass
+
+    def painted(self):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+# key_timer: returns a timer for a keypress received now (a shared no-op timer when instrumentation is off)
+def key_timer():
+    return KeyTimer() if ENABLED else NULL_TIMER
+
+
+# overlay_text: returns the live latency line shown when TYPING_TEST_PROFILE=overlay
+def overlay_text():
+    total = HISTOGRAMS["total"]
+    return f"input→paint p50 ≤{total.percentile_us(50)}µs  p99 ≤{total.percentile_us(99)}µs  ({total.count} keys)"
+
+
+# dump: writes every stage histogram to PROFILE_FILE as JSON
+def dump(path=PROFILE_FILE):
+    with open(path, "w") as f:
+        json.dump({stage: histogram.to_dict() for stage, histogram in HISTOGRAMS.items()}, f, indent=2)
+
+
+if ENABLED:
+    atexit.register(dump)
@@ -0,0 +1,83 @@
+# Name: keytrace.py
+# Description: Compact binary keystroke traces, one file per session, so old sessions can be re-analysed later
+# Author: Sanika Surose
+
+import os
+import struct
+import time
+from collections import namedtuple
+
+# constants
+TRACE_DIR = "traces"
+TRACE_SUFFIX = ".ttr"
+TRACE_MAGIC = b"TTTRACE1"
+TRACE_HEADER = struct.Struct("<8sI")        # magic, byte length of the UTF-8 target text that follows
+TRACE_RECORD = struct.Struct("<IIIB")       # delta µs since the previous key, typed codepoint, expected codepoint, flags
+FLAG_BACKSPACE = 1
+MAX_DELTA_US = 0xFFFFFFFF
+WRITE_BUFFER = 64 * 1024
+
+TraceRecord = namedtuple("TraceRecord", "delta_us typed expected backspace")
+
+
+class TraceWriter:
+    """
+    Buffered writer for one session's keystroke trace (13 bytes per key)
+    """
+    # __init__: creates the trace file and writes the header with the target text
+    def __init__(self, path, target_text):
+        self.path = path
+        text = target_text.encode("utf-8")
+        self.file = open(path, "wb", buffering=WRITE_BUFFER)
+        self.file.write(TRACE_HEADER.pack(TRACE_MAGIC, len(text)))
+        self.file.write(text)
+
+    # write: appends one keystroke record (0 stands for "no codepoint")
+    def write(self, delta_ns, typed, expected, backspace):
+        delta_us = min(delta_ns // 1000, MAX_DELTA_US)
+        self.file.write(TRACE_RECORD.pack(delta_us, typed, expected, FLAG_BACKSPACE if backspace else 0))
+
+    # close: flushes the buffer and closes the file (safe to call twice)
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+# new_trace_path: returns a fresh trace file path in TRACE_DIR, creating the directory if needed
+def new_trace_path():
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    return os.path.join(TRACE_DIR, f"{time.time_ns()}{TRACE_SUFFIX}")
+
+
+# _read_header: reads the header from an open trace file and returns the target text
+def _read_header(f, path):
+    magic, text_length = TRACE_HEADER.unpack(f.read(TRACE_HEADER.size))
+    if magic != TRACE_MAGIC:
+        raise ValueError(f"{path} is not a keystroke trace")
+    return f.read(text_length).decode("utf-8")
+
+
+# read_trace_target: returns the target text a trace was recorded against
+def read_trace_target(path):
+    with open(path, "rb") as f:
+        return _read_header(f, path)
+
+
+# read_trace: streams the keystroke records of a trace, ignoring a partial record left by a crash
+def read_trace(path):
+    with open(path, "rb") as f:
+        _read_header(f, path)
+        while True:
+            data = f.read(TRACE_RECORD.size)
+            if len(data) < TRACE_RECORD.size:
+                return
+            delta_us, typed, expected, flags = TRACE_RECORD.unpack(data)
+            yield TraceRecord(delta_us, typed, expected, bool(flags & FLAG_BACKSPACE))
+
+
+# trace_keys: streams a trace as (key, timestamp_ns) pairs starting at 0, ready for process_key
+def trace_keys(path):
+    now_ns = 0
+    for record in read_trace(path):
+        now_ns += record.delta_us * 1000
+        yield ("\b" if record.backspace else chr(record.typed)), now_ns
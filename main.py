@@ -6,7 +6,14 @@ import curses
 from curses import wrapper
 import time 
 import random
+import corpus
 import engine
+import instrument
+import persistence
+import viewport
+
+# constants
+WPM_TICK = 0.5                  # seconds between WPM label refreshes during a test
 
 # start_screen: display the start screen
 def start_screen(stdscr): 
@@ -16,21 +23,61 @@ def start_screen(stdscr):
     stdscr.refresh()
     stdscr.getkey()                                              
 
-# display_text: displays the target and current text with color feedback for correctness
-def display_text(stdscr, char_states, wpm):
+# display_text: displays the visible lines of the target with color feedback for correctness, and the WPM below them
+def display_text(stdscr, session, view, wpm):
     stdscr.clear()
-    stdscr.addstr(1, 0, f"WPM: {wpm}")                        
+    stdscr.addstr(view.height, 0, wpm)
+
+    display_lines(stdscr, session, view)
+
+    stdscr.refresh()
 
-    for i, (char, state) in enumerate(char_states): 
-        if state == "correct": 
-            color = curses.color_pair(1)
-        elif state == "incorrect": 
-            color = curses.color_pair(2)
-        else: 
-            color = curses.color_pair(3)
-        stdscr.addstr(0, i, char, color)
+# display_lines: paints the lines currently in the viewport (the rest of the passage is never drawn)
+def display_lines(stdscr, session, view):
+    target_text, char_states = session.target_text, session.char_states
+
+    for row in range(view.height):
+        stdscr.move(row, 0)
+        stdscr.clrtoeol()
+
+    for row, start, end in view.lines():
+        for i in range(start, end):
+            stdscr.addstr(row, i - start, target_text[i], state_color(engine.STATE_NAMES[char_states[i]]))
+
+# state_color: returns the color pair used for a character state
+def state_color(state):
+    if state == "correct":
+        return curses.color_pair(1)
+    elif state == "incorrect":
+        return curses.color_pair(2)
+    return curses.color_pair(3)
+
+# wpm_label: returns the WPM line shown during a test: the session average and the live rate over the last few seconds
+def wpm_label(session):
+    return f"WPM: {engine.calculate_wpm(session)}  (last {engine.LIVE_WPM_WINDOW}s: {engine.calculate_live_wpm(session)})"
+
+# display_wpm: repaints only the WPM label (on the row below the passage)
+def display_wpm(stdscr, row, wpm):
+    stdscr.addstr(row, 0, wpm)
+    stdscr.clrtoeol()
+    stdscr.refresh()
+
+# display_changes: repaints only the characters whose state changed since the last repaint,
+# or the whole window when the cursor has moved off it
+def display_changes(stdscr, session, view, changes, timer=instrument.NULL_TIMER):
+    if view.follow(len(session.typed)):
+        display_lines(stdscr, session, view)
+    elif changes:
+        for i, _, state in changes:
+            position = view.position(i)
+            if position is not None:
+                stdscr.addstr(position[0], position[1], session.target_text[i], state_color(state))
+    else:
+        return
+    timer.mark("render")
 
     stdscr.refresh()
+    timer.painted()
 
 # show_results: displays final statistics after a test finishes
 def show_results(stdscr, session):
@@ -63,6 +110,7 @@ def show_feedback_screen(stdscr, session):
     speed_feedback = engine.get_speed_feedback(session)
     tip = engine.get_actionable_tip(session)
     avg_delay = engine.get_average_key_delay(session)
+    delays = engine.get_key_delay_percentiles(session)
 
     stdscr.clear()
     row = 0
@@ -85,6 +133,9 @@ def show_feedback_screen(stdscr, session):
         row += 1
 
     stdscr.addstr(row, 0, f"Avg key delay: {avg_delay:.2f}s")
+    row += 1
+
+    stdscr.addstr(row, 0, f"Key delay median / p90 / p99: {delays['p50']:.2f}s / {delays['p90']:.2f}s / {delays['p99']:.2f}s")
     row += 2
 
     stdscr.addstr(row, 0, f"Tip: {tip}")
@@ -96,6 +147,8 @@ def show_feedback_screen(stdscr, session):
 
 # show_progress_screen: displays the user's typing progress and stats across all saved sessions
 def show_progress_screen(stdscr):
+    # the finished test may still be on its way to disk
+    persistence.flush()
     stats = engine.get_progress_stats()
 
     stdscr.clear()
@@ -115,6 +168,25 @@ def show_progress_screen(stdscr):
         row += 1
         stdscr.addstr(row, 0, f"Average Accuracy: {stats['avg_accuracy']}%")
 
+        weak_keys = engine.get_all_time_weak_keys()
+        if weak_keys:
+            row += 1
+            stdscr.addstr(row, 0, "All-time weak keys: " + ", ".join(f"'{char}' {rate}%" for char, rate in weak_keys))
+        slow_keys = engine.get_all_time_slowest_keys()
+        if slow_keys:
+            row += 1
+            stdscr.addstr(row, 0, "Slowest keys: " + ", ".join(f"'{char}' {delay:.2f}s" for char, delay in slow_keys))
+
+        # trends pulls in NumPy; import it only when progress is first shown
+        import trends
+
+        long_term = trends.get_trends()
+        if long_term:
+            row += 1
+            for line in trends.format_trends(long_term):
+                row += 1
+                stdscr.addstr(row, 0, line)
+
     row += 2
     stdscr.addstr(row, 0, "Press any key to continue")
     stdscr.refresh()
@@ -124,38 +196,60 @@ def show_progress_screen(stdscr):
 def is_escape(key):
     return (len(key) == 1 and ord(key) == 27) or key == '\x1b' or key.startswith('\x1b')
 
-# wpm_test: runs a single typing test session
-def wpm_test(stdscr):
-    session = engine.create_session()
-    stdscr.nodelay(True)
+# wpm_test: runs a single typing test session (on a random line unless target_text is given)
+def wpm_test(stdscr, target_text=None, adaptive=False, difficulty=None):
+    session = engine.create_session(target_text=target_text, adaptive=adaptive, difficulty=difficulty)
     quit_early = False
 
+    # only a window of wrapped lines around the cursor is drawn, so long passages cost the same per key
+    height = max(1, min(viewport.VIEW_LINES, curses.LINES - 3))
+    view = viewport.Viewport(session.target_text, curses.COLS - 1, height)
+
+    # full paint once, then only the cells that change
+    wpm = wpm_label(session)
+    display_text(stdscr, session, view, wpm)
+
+    # block in getkey until a key arrives or the next WPM tick is due, so an idle test does no work
+    next_tick = time.monotonic() + WPM_TICK
     while True:
-        wpm = engine.calculate_wpm(session)
-        char_states = engine.build_char_states(
-            session["target_text"],
-            session["current_text"]
-        )
-        display_text(stdscr, char_states, wpm)
+        stdscr.timeout(max(0, int((next_tick - time.monotonic()) * 1000)))
         try:
             key = stdscr.getkey()
-        except:
-            time.sleep(0.01)
-            continue
-        # ESC ends test early
-        if is_escape(key):
-            quit_early = True
-            break
-        engine.process_key(session, key)
-        # end when sentence length reached
-        if session["finished"]:
-            break
-    
-    stdscr.nodelay(False)
+        except curses.error:
+            key = None
+
+        if key is not None:
+            # ESC ends test early
+            if is_escape(key):
+                quit_early = True
+                engine.close_trace(session)
+                break
+            timer = instrument.key_timer()
+            engine.process_key(session, key)
+            timer.mark("process_key")
+            changes = engine.pop_state_changes(session)
+            timer.mark("char_states")
+            display_changes(stdscr, session, view, changes, timer)
+            # end when sentence length reached
+            if session["finished"]:
+                break
+
+        if time.monotonic() >= next_tick:
+            new_wpm = wpm_label(session)
+            if new_wpm != wpm:
+                wpm = new_wpm
+                display_wpm(stdscr, view.height, wpm)
+            if instrument.OVERLAY:
+                stdscr.addstr(view.height + 1, 0, instrument.overlay_text())
+                stdscr.clrtoeol()
+                stdscr.refresh()
+            next_tick = time.monotonic() + WPM_TICK
+
+    stdscr.timeout(-1)
 
     # save completed session
     if session["finished"]:
-        engine.save_session(session)
+        persistence.save_session_async(session)
 
     show_results(stdscr, session)
     show_feedback_screen(stdscr, session)
@@ -163,8 +257,9 @@ def wpm_test(stdscr):
 
     return quit_early
 
-# main: entry point
-def main(stdscr): 
+# main: entry point; passage_text replaces the random line in every test, adaptive picks lines by the user's mistakes,
+# difficulty draws lines from one bucket of the ingested corpus
+def main(stdscr, passage_text=None, adaptive=False, difficulty=None): 
     curses.init_pair(1, curses.COLOR_GREEN, curses.COLOR_BLACK)    # color pair 1: green on black
     curses.init_pair(2, curses.COLOR_RED, curses.COLOR_BLACK)      # color pair 2: red on black
     curses.init_pair(3, curses.COLOR_WHITE, curses.COLOR_BLACK)    # color pair 3: white on black
@@ -172,7 +267,7 @@ def main(stdscr):
     start_screen(stdscr)
 
     while True:
-        quit_early = wpm_test(stdscr)
+        quit_early = wpm_test(stdscr, passage_text, adaptive, difficulty)
         if quit_early:
             break
         key = stdscr.getkey()
@@ -180,4 +275,13 @@ def main(stdscr):
             break
 
 # wrapper: takes a function and runs it in a curses window
-wrapper(main)
\ No newline at end of file
+if __name__ == "__main__":
+    args = engine.parse_args()
+
+    try:
+        wrapper(main, corpus.read_passage(args.passage) if args.passage else None, args.adaptive, args.difficulty)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # write any queued sessions before exiting
+        persistence.shutdown()
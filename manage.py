@@ -0,0 +1,53 @@
+# Name: manage.py
+# Description: Command-line maintenance tasks for the typing test's saved data (run from the app directory)
+# Author: Sanika Surose
+
+import argparse
+import engine
+
+
+# rebuild_summary: recomputes the progress summary from the raw session history
+def rebuild_summary(args):
+    summary = engine.rebuild_summary()
+    print(f"Rebuilt summary from {summary['count']} sessions")
+
+
+# migrate_sqlite: imports sessions.json / sessions.jsonl into the SQLite store
+def migrate_sqlite(args):
+    try:
+        count = engine.migrate_to_sqlite()
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(f"Imported {count} sessions into {engine.DB_FILE}; run with TYPING_TEST_STORAGE=sqlite to use it")
+
+
+# compact: rolls old sessions into per-day and per-week totals so the history stops growing with every test
+def compact(args):
+    folded = engine.compact_history(args.raw_days, args.daily_days)
+    print(f"Compacted {folded} records; sessions from the last {args.raw_days} days are kept as they are")
+
+
+# main: parses the command line and runs the chosen task
+def main():
+    parser = argparse.ArgumentParser(description="Typing test maintenance tasks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild-summary", help="recompute progress totals from the session history")
+    rebuild.set_defaults(func=rebuild_summary)
+
+    migrate = commands.add_parser("migrate-sqlite", help="import the JSON session history into sessions.db")
+    migrate.set_defaults(func=migrate_sqlite)
+
+    compact_parser = commands.add_parser("compact", help="roll old sessions into per-day and per-week totals")
+    compact_parser.add_argument("--raw-days", type=int, default=engine.RAW_HISTORY_DAYS,
+                                help=f"keep sessions younger than this as they are (default {engine.RAW_HISTORY_DAYS})")
+    compact_parser.add_argument("--daily-days", type=int, default=engine.DAILY_ROLLUP_DAYS,
+                                help=f"keep per-day totals younger than this, weekly before (default {engine.DAILY_ROLLUP_DAYS})")
+    compact_parser.set_defaults(func=compact)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Name: persistence.py
+# Description: Background writer that saves finished sessions off the UI thread, batching writes that arrive close together
+# Author: Sanika Surose
+
+import atexit
+import queue
+import threading
+import traceback
+import engine
+
+# constants
+MAX_PENDING = 64                            # sessions queued before submit() waits for the writer
+FLUSH_DELAY = 0.5                           # seconds the writer waits for more sessions before writing a batch
+_STOP = object()
+_FLUSH = object()                           # ends the current batch early so flush() does not wait out FLUSH_DELAY
+
+
+class SessionWriter:
+    """
+    Owns a worker thread and a bounded queue of session records; the UI thread only enqueues
+    """
+    # __init__: starts the worker thread
+    def __init__(self, max_pending=MAX_PENDING, flush_delay=FLUSH_DELAY):
+        self.queue = queue.Queue(max_pending)
+        self.max_pending = max_pending
+        self.flush_delay = flush_delay
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self.thread.start()
+
+    # submit: queues a finished session for saving and returns immediately
+    def submit(self, session):
+        # the record (and its timestamp) is taken now, not when the worker gets to it
+        self.queue.put(engine.session_record(session))
+
+    # flush: blocks until every queued session has been written
+    def flush(self):
+        self.queue.put(_FLUSH)
+        self.queue.join()
+
+    # close: writes everything still queued and stops the worker (safe to call twice)
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    # _run: worker loop; collects records that arrive within flush_delay of each other (at most max_pending)
+    # and writes them together, so a steady stream of sessions still gets written
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            stopping = batch[0] is _STOP
+            flushing = batch[0] is _FLUSH
+
+            while not (stopping or flushing) and len(batch) < self.max_pending:
+                try:
+                    item = self.queue.get(timeout=self.flush_delay)
+                except queue.Empty:
+                    break
+                stopping = item is _STOP
+                flushing = item is _FLUSH
+                batch.append(item)
+
+            records = [item for item in batch if item is not _STOP and item is not _FLUSH]
+            try:
+                engine.save_records(records)
+            except Exception:
+                # keep the writer alive for later sessions; this batch is reported and dropped
+                traceback.print_exc()
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+            if stopping:
+                return
+
+
+# the process-wide writer, started on first use
+_writer = None
+_writer_lock = threading.Lock()
+
+
+# get_writer: returns the process-wide session writer, starting it on first use
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = SessionWriter()
+            atexit.register(_writer.close)
+        return _writer
+
+
+# save_session_async: queues a finished session to be saved by the background writer
+def save_session_async(session):
+    get_writer().submit(session)
+
+
+# flush: waits until queued sessions are on disk (call before reading history)
+def flush():
+    if _writer is not None:
+        _writer.flush()
+
+
+# shutdown: drains the writer; call on window close or Ctrl-C
+def shutdown():
+    if _writer is not None:
+        _writer.close()
@@ -0,0 +1,139 @@
+# Name: replay.py
+# Description: Headless keystroke replay through the engine, with injected timestamps (no curses or Tk window)
+# Author: Sanika Surose
+
+import argparse
+import json
+import random
+import time
+import engine
+
+# constants
+BACKSPACE = "\b"
+TYPO_CHARS = "abcdefghijklmnopqrstuvwxyz"
+STREAM_PROFILES = ("clean", "typos", "backspace_storm")
+
+
+# synthetic_stream: yields (key, timestamp_ns) pairs that type target_text in the style of `profile`
+#   clean           - every key correct
+#   typos           - ~15% wrong keys, half of them corrected with a backspace
+#   backspace_storm - frequent bursts of up to 10 backspaces that are then retyped
+def synthetic_stream(target_text, profile="clean", seed=0, mean_delay_ms=180):
+    if profile not in STREAM_PROFILES:
+        raise ValueError(f"unknown stream profile: {profile}")
+
+    rng = random.Random(seed)
+    now = 0
+    position = 0
+
+    def tick():
+        nonlocal now
+        now += int(rng.expovariate(1 / mean_delay_ms) * 1e6) + 1
+        return now
+
+    while position < len(target_text):
+        if profile == "typos" and rng.random() < 0.15:
+            yield rng.choice(TYPO_CHARS), tick()
+            if rng.random() < 0.5:
+                yield BACKSPACE, tick()
+            else:
+                position += 1
+            continue
+
+        if profile == "backspace_storm" and position > 10 and rng.random() < 0.05:
+            burst = rng.randint(1, 10)
+            for _ in range(burst):
+                yield BACKSPACE, tick()
+            position -= burst
+            continue
+
+        yield target_text[position], tick()
+        position += 1
+
+
+# load_recording: returns (target_text, [(key, timestamp_ns), ...]) from a JSON recording file
+#   {"target_text": "...", "keys": [["a", 0], ["b", 183000000], ...]}
+def load_recording(path):
+    with open(path, "r") as f:
+        data = json.load(f)
+    return data["target_text"], [(key, int(t)) for key, t in data["keys"]]
+
+
+# replay: feeds a keystroke stream into a new session; returns (session, per-key latencies in ns)
+def replay(target_text, stream, start_ns=0):
+    session = engine.Session(target_text, start_ns=start_ns)
+    latencies = []
+    last_ns = start_ns
+
+    for key, now_ns in stream:
+        begin = time.perf_counter_ns()
+        engine.process_key(session, key, now_ns)
+        latencies.append(time.perf_counter_ns() - begin)
+        last_ns = now_ns
+        if session.finished:
+            break
+
+    # freeze an unfinished session at its last key so its WPM does not depend on the wall clock
+    if session.end_ns is None:
+        session.end_ns = last_ns
+
+    return session, latencies
+
+
+# analyze: runs every post-test analytics helper on a session and returns their results
+def analyze(session):
+    return {
+        "wpm": engine.calculate_wpm(session),
+        "accuracy": engine.calculate_accuracy(session),
+        "mistakes": session.mistakes,
+        "profile": engine.get_performance_profile(session),
+        "consistency": engine.get_speed_feedback(session),
+        "avg_key_delay": engine.get_average_key_delay(session),
+        "key_delay_percentiles": engine.get_key_delay_percentiles(session),
+        "weak_keys": engine.get_weak_keys(session),
+        "top_mistakes": engine.get_top_mistakes(session),
+        "tip": engine.get_actionable_tip(session),
+    }
+
+
+# percentile: returns the p-th percentile (0-100) of already sorted values (nearest rank)
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    rank = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+# summarize_latencies: returns keys per second and p50/p99/max per-key latency (microseconds)
+def summarize_latencies(latencies):
+    ordered = sorted(latencies)
+    total_ns = sum(ordered)
+    return {
+        "keys": len(ordered),
+        "keys_per_second": round(len(ordered) / (total_ns / 1e9)) if total_ns else 0,
+        "p50_us": round(percentile(ordered, 50) / 1000, 3),
+        "p99_us": round(percentile(ordered, 99) / 1000, 3),
+        "max_us": round(ordered[-1] / 1000, 3) if ordered else 0,
+    }
+
+
+# main: replays a recording (or a synthetic stream over a random passage) and prints the analytics
+def main():
+    parser = argparse.ArgumentParser(description="Replay keystrokes through the typing engine without a UI")
+    parser.add_argument("recording", nargs="?", help="JSON recording to replay (default: synthetic stream)")
+    parser.add_argument("--profile", choices=STREAM_PROFILES, default="clean", help="synthetic stream style")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the synthetic stream")
+    args = parser.parse_args()
+
+    if args.recording:
+        target_text, stream = load_recording(args.recording)
+    else:
+        target_text = engine.load_text()
+        stream = synthetic_stream(target_text, args.profile, args.seed)
+
+    session, latencies = replay(target_text, stream)
+    print(json.dumps({"analytics": analyze(session), "latency": summarize_latencies(latencies)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Name: score.py
+# Description: Re-scores a directory of recorded sessions offline with a process pool, streaming the results to CSV
+# Author: Sanika Surose
+
+import argparse
+import csv
+import os
+import struct
+import sys
+from multiprocessing import Pool
+import engine
+import keytrace
+import replay
+
+# constants
+RECORDING_SUFFIXES = (keytrace.TRACE_SUFFIX, ".json")
+CSV_FIELDS = ["path", "chars", "keystrokes", "wpm", "accuracy", "mistakes", "profile", "weak_keys", "error"]
+
+
+# iter_recordings: yields the paths of keystroke traces and JSON recordings under a directory
+def iter_recordings(directory):
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(RECORDING_SUFFIXES):
+                yield os.path.join(root, name)
+
+
+# score_recording: replays one recording through the engine and returns its CSV row (runs in a worker)
+def score_recording(path):
+    row = {"path": path}
+    try:
+        if path.endswith(keytrace.TRACE_SUFFIX):
+            target_text, stream = keytrace.read_trace_target(path), keytrace.trace_keys(path)
+        else:
+            target_text, stream = replay.load_recording(path)
+
+        session, latencies = replay.replay(target_text, stream)
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        return row
+
+    row.update({
+        "chars": len(target_text),
+        "keystrokes": len(latencies),
+        "wpm": engine.calculate_wpm(session),
+        "accuracy": engine.calculate_accuracy(session),
+        "mistakes": session.mistakes,
+        "profile": engine.get_performance_profile(session),
+        "weak_keys": "".join(char for char, _ in engine.get_weak_keys(session))
+    })
+    return row
+
+
+# score_directory: scores every recording under directory on `workers` processes and writes CSV rows as they finish
+def score_directory(directory, out, workers=None, chunksize=64):
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+
+    count = 0
+    with Pool(workers) as pool:
+        for row in pool.imap_unordered(score_recording, iter_recordings(directory), chunksize):
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+# main: parses the command line and scores the recordings
+def main():
+    parser = argparse.ArgumentParser(description="Re-score recorded typing sessions in parallel")
+    parser.add_argument("directory", help="directory of keystroke traces (.ttr) or JSON recordings")
+    parser.add_argument("--out", default="-", help="CSV file to write (default: stdout)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--chunksize", type=int, default=64, help="recordings handed to a worker at a time")
+    args = parser.parse_args()
+
+    if args.out == "-":
+        count = score_directory(args.directory, sys.stdout, args.workers, args.chunksize)
+    else:
+        with open(args.out, "w", newline="") as out:
+            count = score_directory(args.directory, out, args.workers, args.chunksize)
+
+    print(f"Scored {count} recordings", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# Name: server.py
+# Description: Asyncio multi-user typing server over a line-oriented TCP protocol, plus a local load generator
+# Author: Sanika Surose
+
+"""
+Protocol (UTF-8, one message per line):
+
+  server -> client   TEXT <target text>            sent on connect and after NEW
+  client -> server   KEY <char>                    one typed character (the character right after "KEY ")
+  client -> server   BACKSPACE
+  server -> client   STATE <index> <state>         one per changed character (correct / incorrect / untyped)
+  server -> client   WPM <wpm>                     ends the reply to every KEY / BACKSPACE
+  server -> client   DONE <wpm> <accuracy> <mistakes>   after the last character; later KEY / BACKSPACE get
+                                                   "ERROR finished; send NEW" and leave the result as it is
+  client -> server   NEW                           start another passage
+  client -> server   QUIT
+  server -> client   ERROR <message>
+"""
+
+import argparse
+import asyncio
+import random
+import subprocess
+import sys
+import time
+import engine
+import replay
+
+# constants
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+# reply_lines: returns the protocol lines answering one keystroke
+def reply_lines(session):
+    lines = [f"STATE {i} {new_state}" for i, _, new_state in engine.pop_state_changes(session)]
+    lines.append(f"WPM {engine.calculate_wpm(session)}")
+    if session.finished:
+        lines.append(f"DONE {engine.calculate_wpm(session)} {engine.calculate_accuracy(session)} {session.mistakes}")
+    return lines
+
+
+# new_session: starts a session on the shared race passage, or a random one
+def new_session(shared_text):
+    return engine.create_session(record_trace=False, target_text=shared_text)
+
+
+# handle_client: runs one connection's typing session
+async def handle_client(reader, writer, shared_text=None):
+    session = new_session(shared_text)
+    writer.write(f"TEXT {session.target_text}\n".encode("utf-8"))
+
+    try:
+        while True:
+            await writer.drain()
+            data = await reader.readline()
+            if not data:
+                break
+
+            line = data.decode("utf-8").rstrip("\r\n")
+            if (line == "BACKSPACE" or line.startswith("KEY ")) and session.finished:
+                # the result is final once DONE is sent
+                lines = ["ERROR finished; send NEW"]
+            elif line.startswith("KEY ") and len(line) == 5:
+                engine.process_key(session, line[4])
+                lines = reply_lines(session)
+            elif line == "BACKSPACE":
+                engine.process_key(session, "\b")
+                lines = reply_lines(session)
+            elif line == "NEW":
+                session = new_session(shared_text)
+                lines = [f"TEXT {session.target_text}"]
+            elif line == "QUIT":
+                break
+            else:
+                lines = [f"ERROR unknown command: {line[:40]}"]
+
+            writer.write(("\n".join(lines) + "\n").encode("utf-8"))
+    except (ConnectionError, UnicodeDecodeError):
+        pass
+    finally:
+        writer.close()
+
+
+# serve: accepts connections until cancelled
+async def serve(host, port, shared_text=None):
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_client(reader, writer, shared_text), host, port, backlog=4096
+    )
+    print(f"Typing server listening on {host}:{port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+# typist: one simulated client; types its passage and appends each key's round-trip time (ns) to latencies
+async def typist(host, port, keys, mean_delay_ms, seed, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    target_text = (await reader.readline()).decode("utf-8").rstrip("\n")[len("TEXT "):]
+    rng = random.Random(seed)
+
+    stream = replay.synthetic_stream(target_text, "typos", seed)
+    sent = 0
+    for key, _ in stream:
+        if sent >= keys:
+            break
+        await asyncio.sleep(rng.expovariate(1000 / mean_delay_ms) if mean_delay_ms else 0)
+
+        start = time.perf_counter_ns()
+        writer.write(b"BACKSPACE\n" if key == replay.BACKSPACE else f"KEY {key}\n".encode("utf-8"))
+        while True:
+            line = await reader.readline()
+            if not line or line.startswith((b"WPM", b"ERROR")):
+                break
+        latencies.append(time.perf_counter_ns() - start)
+        sent += 1
+
+    writer.write(b"QUIT\n")
+    await writer.drain()
+    writer.close()
+
+
+# load_test: runs `clients` simulated typists at once and prints throughput and round-trip latency
+async def load_test(host, port, clients, keys, mean_delay_ms):
+    latencies = []
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(typist(host, port, keys, mean_delay_ms, seed, latencies) for seed in range(clients)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if isinstance(r, Exception)]
+    summary = replay.summarize_latencies(latencies)
+    print(f"{clients - len(failed)}/{clients} typists, {summary['keys']} keys in {elapsed:.2f}s "
+          f"= {summary['keys'] / elapsed:.0f} keys/s")
+    print(f"round trip p50 {summary['p50_us'] / 1000:.3f} ms  p99 {summary['p99_us'] / 1000:.3f} ms  "
+          f"max {summary['max_us'] / 1000:.3f} ms")
+    if failed:
+        print(f"{len(failed)} typists failed, first error: {failed[0]!r}")
+
+
+# main: runs the server or the load generator
+def main():
+    parser = argparse.ArgumentParser(description="Multi-user typing server")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="host typing sessions over TCP")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--race", action="store_true", help="give every connection the same passage")
+
+    load_parser = commands.add_parser("loadgen", help="simulate many typists against a server")
+    load_parser.add_argument("--host", default=DEFAULT_HOST)
+    load_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    load_parser.add_argument("--clients", type=int, default=1000, help="simulated typists (mind ulimit -n)")
+    load_parser.add_argument("--keys", type=int, default=100, help="keystrokes per typist")
+    load_parser.add_argument("--delay-ms", type=float, default=150, help="mean delay between a typist's keys (0 = flat out)")
+    load_parser.add_argument("--start-server", action="store_true", help="launch 'server.py serve' for the run")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, engine.load_text() if args.race else None))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    server = None
+    if args.start_server:
+        server = subprocess.Popen([sys.executable, __file__, "serve", "--host", args.host, "--port", str(args.port)],
+                                  stdout=subprocess.PIPE)
+        server.stdout.readline()
+    try:
+        asyncio.run(load_test(args.host, args.port, args.clients, args.keys, args.delay_ms))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# Name: sketch.py
+# Description: Log-bucketed key-delay histograms with bounded memory and bounded relative error on quantiles
+# Author: Sanika Surose
+
+from array import array
+from math import ceil, log
+
+# constants
+RELATIVE_ACCURACY = 0.02                    # quantiles are within 2% of a delay that was actually recorded
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = log(GAMMA)
+MIN_DELAY = 0.001                           # seconds; shorter delays share the first bucket
+BUCKETS = 300                               # bucket i covers (MIN_DELAY * GAMMA**(i-1), MIN_DELAY * GAMMA**i], up to ~150 s
+
+
+# bucket_index: returns the bucket a delay (seconds) falls in; delays past the last bucket are clamped into it
+def bucket_index(delay):
+    if delay <= MIN_DELAY:
+        return 0
+    return min(BUCKETS - 1, ceil(log(delay / MIN_DELAY) / LOG_GAMMA))
+
+
+# bucket_value: returns the delay reported for a bucket, within RELATIVE_ACCURACY of anything in it
+def bucket_value(index):
+    if index == 0:
+        return MIN_DELAY
+    return MIN_DELAY * 2 * GAMMA ** index / (GAMMA + 1)
+
+
+class DelayHistogram:
+    """
+    Key delays in seconds, bucketed on a log scale. Only the range of buckets seen so far is stored
+    (never more than BUCKETS counters). count, mean, m2 (Welford), min and max are exact and O(1) to read;
+    quantiles are approximate. total and total_sq feed the saved per-character totals.
+    """
+    __slots__ = ("offset", "counts", "count", "mean", "m2", "min", "max", "total", "total_sq")
+
+    def __init__(self):
+        self.offset = 0                         # bucket index of counts[0]
+        self.counts = array("I")
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0                           # sum of squared differences from the mean
+        self.min = None
+        self.max = None
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    # add: records one delay in O(1) (bucket_index is inlined; this runs twice per keystroke)
+    def add(self, delay):
+        self.count += 1
+        diff = delay - self.mean
+        self.mean += diff / self.count
+        self.m2 += diff * (delay - self.mean)
+        self.total += delay
+        self.total_sq += delay * delay
+        if self.count == 1:
+            self.min = self.max = delay
+        elif delay < self.min:
+            self.min = delay
+        elif delay > self.max:
+            self.max = delay
+
+        index = 0 if delay <= MIN_DELAY else min(BUCKETS - 1, ceil(log(delay / MIN_DELAY) / LOG_GAMMA))
+        slot = index - self.offset
+        counts = self.counts
+        if 0 <= slot < len(counts):
+            counts[slot] += 1
+        else:
+            self._cover(index)
+            self.counts[index - self.offset] += 1
+
+    # _cover: grows the stored bucket range to include index
+    def _cover(self, index):
+        counts = self.counts
+        if not counts:
+            self.offset = index
+            counts.append(0)
+        elif index < self.offset:
+            self.counts = array("I", bytes(4 * (self.offset - index))) + counts
+            self.offset = index
+        elif index >= self.offset + len(counts):
+            counts.frombytes(bytes(4 * (index - self.offset - len(counts) + 1)))
+
+    # merge: adds every delay recorded in other to this histogram
+    def merge(self, other):
+        if not other.count:
+            return
+        self._cover(other.offset)
+        self._cover(other.offset + len(other.counts) - 1)
+        for i, bucket_count in enumerate(other.counts):
+            self.counts[other.offset - self.offset + i] += bucket_count
+
+        # combined mean and m2 of two Welford states (Chan et al.)
+        count = self.count + other.count
+        diff = other.mean - self.mean
+        self.m2 += other.m2 + diff * diff * self.count * other.count / count
+        self.mean += diff * other.count / count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.count = count
+        self.total += other.total
+        self.total_sq += other.total_sq
+
+    # variance: returns the exact population variance of the delays (0.0 when empty)
+    def variance(self):
+        return self.m2 / self.count if self.count else 0.0
+
+    # quantile: returns the q-th quantile (0-1) of the delays, within RELATIVE_ACCURACY (0.0 when empty)
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen > rank:
+                return min(max(bucket_value(self.offset + i), self.min), self.max)
+        return self.max
+
+    # values: returns an approximate list of the recorded delays, one bucket estimate per delay
+    def values(self):
+        delays = []
+        for i, bucket_count in enumerate(self.counts):
+            delays.extend([min(max(bucket_value(self.offset + i), self.min), self.max)] * bucket_count)
+        return delays
@@ -0,0 +1,189 @@
+# Name: sqlite_store.py
+# Description: Optional SQLite session store used by engine.py when TYPING_TEST_STORAGE=sqlite
+# Author: Sanika Surose
+
+import os
+import sqlite3
+
+# one connection for the whole process, opened on first use
+_connection = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    wpm INTEGER NOT NULL,
+    accuracy REAL NOT NULL,
+    mistakes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_timestamp ON sessions (timestamp);
+CREATE INDEX IF NOT EXISTS sessions_wpm ON sessions (wpm);
+CREATE TABLE IF NOT EXISTS char_stats (
+    char TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    delay_count INTEGER NOT NULL,
+    delay_sum REAL NOT NULL,
+    delay_sumsq REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    period TEXT NOT NULL,
+    start REAL NOT NULL,
+    count INTEGER NOT NULL,
+    wpm_sum INTEGER NOT NULL,
+    wpm_max INTEGER NOT NULL,
+    accuracy_sum REAL NOT NULL,
+    mistakes_sum INTEGER NOT NULL,
+    PRIMARY KEY (period, start)
+);
+"""
+
+COLUMNS = "timestamp, wpm, accuracy, mistakes"
+CHAR_COLUMNS = "attempts, errors, delay_count, delay_sum, delay_sumsq"
+ROLLUP_COLUMNS = "period, start, count, wpm_sum, wpm_max, accuracy_sum, mistakes_sum"
+
+
+# connect: returns (connection, created) for the process-wide connection; created is True only when the file was new
+def connect(path):
+    global _connection
+    if _connection is not None:
+        return _connection, False
+
+    created = not os.path.exists(path)
+    # shared with the background session writer thread; engine.py serializes writes
+    _connection = sqlite3.connect(path, check_same_thread=False)
+    _connection.row_factory = sqlite3.Row
+    _connection.execute("PRAGMA journal_mode=WAL")
+    _connection.executescript(SCHEMA)
+    return _connection, created
+
+
+# close: closes the process-wide connection (the next connect opens a new one)
+def close():
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
+
+
+# _record: converts a row to the session record dict used by engine.py
+def _record(row):
+    return {"timestamp": row["timestamp"], "wpm": row["wpm"], "accuracy": row["accuracy"], "mistakes": row["mistakes"]}
+
+
+# import_sessions: stores many session records in one transaction; returns how many were imported
+def import_sessions(conn, records):
+    with conn:
+        cursor = conn.executemany(
+            f"INSERT INTO sessions ({COLUMNS}) VALUES (?, ?, ?, ?)",
+            ((r["timestamp"], r["wpm"], r["accuracy"], r["mistakes"]) for r in records)
+        )
+    return cursor.rowcount
+
+
+# iter_sessions: streams all session records in the order they were saved
+def iter_sessions(conn):
+    for row in conn.execute(f"SELECT {COLUMNS} FROM sessions ORDER BY id"):
+        yield _record(row)
+
+
+# rows_after: returns (id, timestamp, wpm, accuracy, mistakes) rows with id greater than last_id, in id order
+def rows_after(conn, last_id):
+    return conn.execute(f"SELECT id, {COLUMNS} FROM sessions WHERE id > ? ORDER BY id", (last_id,)).fetchall()
+
+
+# progress_stats: returns (count, best wpm, average wpm, average accuracy) over the sessions and rollups,
+# computed by SQLite
+def progress_stats(conn):
+    count, best_wpm, wpm_sum, accuracy_sum = conn.execute(
+        """SELECT SUM(n), MAX(best), SUM(wpm_sum), SUM(accuracy_sum) FROM (
+               SELECT COUNT(*) AS n, MAX(wpm) AS best, SUM(wpm) AS wpm_sum, SUM(accuracy) AS accuracy_sum FROM sessions
+               UNION ALL
+               SELECT SUM(count), MAX(wpm_max), SUM(wpm_sum), SUM(accuracy_sum) FROM rollups)"""
+    ).fetchone()
+    if not count:
+        return 0, None, None, None
+    return count, best_wpm, wpm_sum / count, accuracy_sum / count
+
+
+# recent_sessions: returns the last `limit` sessions by timestamp, oldest first
+def recent_sessions(conn, limit):
+    rows = conn.execute(f"SELECT {COLUMNS} FROM sessions ORDER BY timestamp DESC LIMIT ?", (limit,)).fetchall()
+    return [_record(row) for row in reversed(rows)]
+
+
+# sessions_between: returns the sessions with start <= timestamp <= end, oldest first
+def sessions_between(conn, start, end):
+    rows = conn.execute(
+        f"SELECT {COLUMNS} FROM sessions WHERE timestamp BETWEEN ? AND ? ORDER BY timestamp", (start, end)
+    )
+    return [_record(row) for row in rows]
+
+
+# best_in_range: returns the highest-WPM session with start <= timestamp <= end, or None
+def best_in_range(conn, start, end):
+    row = conn.execute(
+        f"SELECT {COLUMNS} FROM sessions WHERE timestamp BETWEEN ? AND ? ORDER BY wpm DESC, timestamp LIMIT 1",
+        (start, end)
+    ).fetchone()
+    return _record(row) if row else None
+
+
+# merge_char_stats: adds {char: [attempts, errors, delay_count, delay_sum, delay_sumsq]} to the per-character totals
+def merge_char_stats(conn, stats):
+    with conn:
+        conn.executemany(
+            f"""INSERT INTO char_stats (char, {CHAR_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (char) DO UPDATE SET
+                    attempts = attempts + excluded.attempts,
+                    errors = errors + excluded.errors,
+                    delay_count = delay_count + excluded.delay_count,
+                    delay_sum = delay_sum + excluded.delay_sum,
+                    delay_sumsq = delay_sumsq + excluded.delay_sumsq""",
+            ((char, *totals) for char, totals in stats.items())
+        )
+
+
+# char_stats: returns the per-character totals as {char: [attempts, errors, delay_count, delay_sum, delay_sumsq]}
+def char_stats(conn):
+    return {row["char"]: list(row)[1:] for row in conn.execute(f"SELECT char, {CHAR_COLUMNS} FROM char_stats")}
+
+
+# _insert_rollups: inserts rollup records in the caller's transaction
+def _insert_rollups(conn, rollups):
+    conn.executemany(
+        f"INSERT INTO rollups ({ROLLUP_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        ((r["period"], r["start"], r["count"], r["wpm_sum"], r["wpm_max"], r["accuracy_sum"], r["mistakes_sum"])
+         for r in rollups)
+    )
+
+
+# import_rollups: stores per-day/per-week rollup records (see engine.compact_history) in one transaction
+def import_rollups(conn, rollups):
+    with conn:
+        _insert_rollups(conn, rollups)
+
+
+# rollups: returns the rollup records, oldest first
+def rollups(conn):
+    return [dict(row) for row in conn.execute(f"SELECT {ROLLUP_COLUMNS} FROM rollups ORDER BY start, period")]
+
+
+# sessions_before: returns the sessions with timestamp < end, in the order they were saved
+def sessions_before(conn, end):
+    return [_record(row) for row in conn.execute(f"SELECT {COLUMNS} FROM sessions WHERE timestamp < ? ORDER BY id", (end,))]
+
+
+# generation: returns how many times the history has been compacted (stored as the database user_version)
+def generation(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+# compact: replaces the sessions before `cutoff` and every existing rollup with `rollups` in one transaction,
+# and bumps the generation so row cursors taken before it are invalidated
+def compact(conn, cutoff, rollups):
+    with conn:
+        conn.execute("DELETE FROM sessions WHERE timestamp < ?", (cutoff,))
+        conn.execute("DELETE FROM rollups")
+        _insert_rollups(conn, rollups)
+        conn.execute(f"PRAGMA user_version = {generation(conn) + 1}")
@@ -0,0 +1,73 @@
+# Name: tktext.py
+# Description: Incremental per-character coloring of a tk.Text widget for the typing screen (plain tkinter, no CustomTkinter)
+# Author: Sanika Surose
+
+import tkinter as tk
+import engine
+
+
+# char_index: returns the tk.Text index of character i of the target text (counts characters, so wrapping does not matter)
+def char_index(i):
+    return f"1.0+{i}c"
+
+
+# load_target: replaces the widget contents with the target text, all tagged "untyped" (once per test)
+def load_target(text_widget, target_text):
+    text_widget.config(state=tk.NORMAL)
+    text_widget.delete("1.0", tk.END)
+    text_widget.insert("1.0", target_text, "untyped")
+    text_widget.config(state=tk.DISABLED)
+
+
+# _runs: groups (index, old_state, new_state) changes into (start, end, old_state, new_state) runs of adjacent indices
+def _runs(changes):
+    runs = []
+    for i, old_state, new_state in sorted(changes):
+        if runs and runs[-1][1] == i and runs[-1][2] == old_state and runs[-1][3] == new_state:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1, old_state, new_state])
+    return runs
+
+
+# apply_state_changes: moves the state tags on the changed ranges only; the text itself is never re-inserted
+def apply_state_changes(text_widget, changes):
+    # tag changes do not need the widget to be editable
+    for start, end, old_state, new_state in _runs(changes):
+        text_widget.tag_remove(old_state, char_index(start), char_index(end))
+        text_widget.tag_add(new_state, char_index(start), char_index(end))
+
+
+# window_index: returns the tk.Text index of target character i in a viewport window (None if it is scrolled out of view)
+def window_index(view, i):
+    position = view.position(i)
+    return None if position is None else f"{position[0] + 1}.{position[1]}"
+
+
+# load_window: replaces the widget contents with the viewport's lines, one tagged insert per run of equal states
+def load_window(text_widget, view, target_text, char_states):
+    text_widget.config(state=tk.NORMAL)
+    text_widget.delete("1.0", tk.END)
+
+    for row, start, end in view.lines():
+        if row:
+            text_widget.insert(tk.END, "\n")
+        i = start
+        while i < end:
+            j = i + 1
+            while j < end and char_states[j] == char_states[i]:
+                j += 1
+            text_widget.insert(tk.END, target_text[i:j], engine.STATE_NAMES[char_states[i]])
+            i = j
+
+    text_widget.config(state=tk.DISABLED)
+
+
+# apply_window_changes: apply_state_changes for a widget showing a viewport window; changes out of view are skipped
+def apply_window_changes(text_widget, view, changes):
+    for start, end, old_state, new_state in _runs(changes):
+        first, last = window_index(view, start), window_index(view, end - 1)
+        if first is None or last is None:
+            continue
+        text_widget.tag_remove(old_state, first, f"{last}+1c")
+        text_widget.tag_add(new_state, first, f"{last}+1c")
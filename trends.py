@@ -0,0 +1,153 @@
+# Name: trends.py
+# Description: Long-term history analytics (rolling WPM, percentiles, per-day buckets, improvement slope) computed with NumPy
+# Author: Sanika Surose
+
+import os
+import time
+import zipfile
+import engine
+
+try:
+    import numpy as np
+except ImportError:         # trends are optional; the progress screens skip them without NumPy
+    np = None
+
+# constants
+ROLLING_WINDOW = 10                         # sessions in the rolling WPM average
+SECONDS_PER_DAY = 86400
+CACHE_FILE = "trends_cache.npz"             # history columns already parsed, with the cursor they cover
+COLUMNS = 5                                 # timestamp, wpm, accuracy, mistakes, sessions (see engine.session_rows_since)
+
+
+# _load_cache: returns (table, cursor) from the column cache, or None if there is no usable cache
+def _load_cache():
+    try:
+        with np.load(CACHE_FILE) as cache:
+            table = cache["table"]
+            if table.ndim != 2 or table.shape[1] != COLUMNS:
+                return None
+            cursor = (str(cache["backend"]), int(cache["identity"]), int(cache["position"]))
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        # missing, empty or garbled (e.g. cut short by a crash); load_columns rebuilds it
+        return None
+    return table, cursor
+
+
+# _save_cache: writes the column table and the history cursor it covers through a temp file
+def _save_cache(table, cursor):
+    tmp_path = CACHE_FILE + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, table=table, backend=cursor[0], identity=cursor[1], position=cursor[2])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, CACHE_FILE)
+
+
+# load_columns: returns the saved history as NumPy arrays (timestamp, wpm, accuracy, mistakes, sessions), oldest
+# first; a compacted period is one row of its means with sessions > 1. Only sessions saved since the last call
+# are parsed, the rest comes from the column cache
+def load_columns():
+    cached = _load_cache()
+    result = engine.session_rows_since(cached[1]) if cached else None
+
+    if result is None:
+        rows, cursor = engine.session_rows_since(None)
+        table = np.array(rows, dtype=np.float64).reshape(-1, COLUMNS)
+        _save_cache(table, cursor)
+    else:
+        rows, cursor = result
+        table = cached[0]
+        if rows:
+            table = np.concatenate((table, np.array(rows, dtype=np.float64).reshape(-1, COLUMNS)))
+            _save_cache(table, cursor)
+
+    table = table[np.argsort(table[:, 0], kind="stable")]
+    return {
+        "timestamp": table[:, 0],
+        "wpm": table[:, 1],
+        "accuracy": table[:, 2],
+        "mistakes": table[:, 3],
+        "sessions": table[:, 4]
+    }
+
+
+# rolling_mean: returns the mean of every `window`-long run of values (empty if there are fewer values)
+def rolling_mean(values, window):
+    if len(values) < window:
+        return np.empty(0)
+    sums = np.cumsum(np.concatenate(([0.0], values)))
+    return (sums[window:] - sums[:-window]) / window
+
+
+# daily_buckets: returns (day numbers, tests per day, average WPM per day) in local time
+def daily_buckets(timestamps, wpm):
+    offset = time.localtime().tm_gmtoff
+    days = np.floor((timestamps + offset) / SECONDS_PER_DAY).astype(np.int64)
+    unique_days, inverse = np.unique(days, return_inverse=True)
+    counts = np.bincount(inverse)
+    return unique_days, counts, np.bincount(inverse, weights=wpm) / counts
+
+
+# improvement_slope: returns the least-squares WPM change per day across the history, each row weighted by the
+# sessions it stands for
+def improvement_slope(timestamps, wpm, sessions=None):
+    if len(wpm) < 2 or np.ptp(timestamps) == 0:
+        return 0.0
+    days = (timestamps - timestamps[0]) / SECONDS_PER_DAY
+    weights = None if sessions is None else np.sqrt(sessions)
+    slope, _ = np.polyfit(days, wpm, 1, w=weights)
+    return float(slope)
+
+
+# get_trends: returns long-term trend statistics, or None without NumPy or with fewer than two sessions.
+# Compacted periods (engine.compact_history) only keep their means, so the distribution figures (rolling average,
+# percentiles, day buckets) cover the raw sessions after the last one, from "raw_since" on (None if nothing
+# was compacted); the average mistakes and the slope cover the whole history
+def get_trends(window=ROLLING_WINDOW):
+    if np is None:
+        return None
+
+    columns = load_columns()
+    timestamps, wpm, sessions = columns["timestamp"], columns["wpm"], columns["sessions"]
+    if sessions.sum() < 2:
+        return None
+
+    compacted = sessions > 1
+    raw = timestamps > timestamps[compacted].max() if compacted.any() else np.ones(len(wpm), dtype=bool)
+    raw_timestamps, raw_wpm = timestamps[raw], wpm[raw]
+    if len(raw_wpm) < 2:
+        return None
+
+    rolling = rolling_mean(raw_wpm, min(window, len(raw_wpm)))
+    p10, p50, p90 = np.percentile(raw_wpm, [10, 50, 90])
+    days, day_counts, day_wpm = daily_buckets(raw_timestamps, raw_wpm)
+
+    return {
+        "rolling_window": min(window, len(raw_wpm)),
+        "rolling_wpm": round(float(rolling[-1]), 1),
+        "best_rolling_wpm": round(float(rolling.max()), 1),
+        "wpm_p10": round(float(p10), 1),
+        "wpm_median": round(float(p50), 1),
+        "wpm_p90": round(float(p90), 1),
+        "avg_mistakes": round(float((columns["mistakes"] * sessions).sum() / sessions.sum()), 1),
+        "days_active": int(len(days)),
+        "best_day_wpm": round(float(day_wpm.max()), 1),
+        "tests_per_active_day": round(float(day_counts.mean()), 1),
+        "wpm_per_day": round(improvement_slope(timestamps, wpm, sessions), 2),
+        "raw_since": float(raw_timestamps[0]) if compacted.any() else None
+    }
+
+
+# format_trends: returns the trend statistics as display lines for the progress screens
+def format_trends(trends):
+    # after compaction the distribution lines say which sessions they cover
+    scope = ""
+    if trends["raw_since"] is not None:
+        scope = time.strftime(" (tests since %Y-%m-%d)", time.localtime(trends["raw_since"]))
+
+    return [
+        f"Last {trends['rolling_window']} tests avg WPM: {trends['rolling_wpm']} (best run {trends['best_rolling_wpm']}){scope}",
+        f"WPM p10 / median / p90: {trends['wpm_p10']} / {trends['wpm_median']} / {trends['wpm_p90']}{scope}",
+        f"Active days: {trends['days_active']} (best day avg {trends['best_day_wpm']} WPM){scope}",
+        f"Trend: {trends['wpm_per_day']:+} WPM per day"
+    ]
@@ -0,0 +1,93 @@
+# Name: viewport.py
+# Description: Lazy word wrap and a scrolling window of lines, so long passages render only the lines around the cursor
+# Author: Sanika Surose
+
+from array import array
+from bisect import bisect_right
+
+# constants
+VIEW_LINES = 5                              # lines of the passage shown at once; longer passages scroll
+CONTEXT_LINES = 1                           # typed lines kept above the cursor after a scroll
+
+
+class Layout:
+    """
+    Greedy word wrap of a passage into lines of at most `width` characters. Line starts are
+    computed only as far as the cursor has needed them, so a book-length passage starts instantly.
+    """
+    __slots__ = ("text", "width", "starts")
+
+    def __init__(self, text, width):
+        self.text = text
+        self.width = max(1, width)
+        self.starts = array("q", [0])           # start index of every line wrapped so far
+
+    # _wrap_next: wraps one more line; returns False once the last line has been reached
+    def _wrap_next(self):
+        start = self.starts[-1]
+        end = start + self.width
+        if end >= len(self.text):
+            return False
+
+        # break after the last space that fits; a word longer than the line is split
+        space = self.text.rfind(" ", start, end)
+        if space > start:
+            end = space + 1
+        self.starts.append(end)
+        return True
+
+    # wrap_lines: wraps up to `count` lines and returns how many exist (at most count)
+    def wrap_lines(self, count):
+        while len(self.starts) < count and self._wrap_next():
+            pass
+        return min(count, len(self.starts))
+
+    # line_of: returns the line holding character i (i == len(text) is on the last line)
+    def line_of(self, i):
+        while self.starts[-1] <= i and self._wrap_next():
+            pass
+        return bisect_right(self.starts, i) - 1
+
+    # span: returns (start, end) character indices of a line
+    def span(self, line):
+        self.wrap_lines(line + 2)
+        end = self.starts[line + 1] if line + 1 < len(self.starts) else len(self.text)
+        return self.starts[line], end
+
+
+class Viewport:
+    """
+    A window of `height` wrapped lines over the passage that follows the cursor
+    """
+    __slots__ = ("layout", "height", "top")
+
+    # __init__: the window is shorter than `height` when the whole passage fits in fewer lines
+    def __init__(self, text, width, height=VIEW_LINES):
+        self.layout = Layout(text, width)
+        self.height = max(1, self.layout.wrap_lines(height))
+        self.top = 0
+
+    # follow: scrolls so the cursor's line is shown; returns True if the window moved and must be repainted
+    def follow(self, cursor):
+        line = self.layout.line_of(cursor)
+        if self.top <= line < self.top + self.height:
+            return False
+
+        self.top = max(0, line - min(CONTEXT_LINES, self.height - 1))
+        return True
+
+    # lines: yields (row, start, end) for each line in the window
+    def lines(self):
+        for row in range(self.height):
+            line = self.top + row
+            if self.layout.wrap_lines(line + 1) <= line:
+                return
+            start, end = self.layout.span(line)
+            yield row, start, end
+
+    # position: returns the (row, column) of character i in the window, or None if it is scrolled out of view
+    def position(self, i):
+        line = self.layout.line_of(i)
+        if not self.top <= line < self.top + self.height:
+            return None
+        return line - self.top, i - self.layout.starts[line]